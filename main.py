@@ -4,30 +4,2732 @@ import os
 # .venv内のプラグインのパスに環境変数を設定
 os.environ["QT_QPA_PLATFORM_PLUGIN_PATH"] = ".venv/lib/python3.12/site-packages/PyQt5/Qt5/plugins/platforms"
 
+import argparse
+import base64
 import csv
 import re
+import json
+import multiprocessing
+import time
+import hashlib
+import functools
+import mmap
+import struct
+import threading
+import unicodedata
+import random
+import ssl
+import http.client
+import urllib.parse
 import urllib.request
+from urllib.error import HTTPError, URLError
 import tempfile
+from array import array
+from collections import OrderedDict
+from itertools import compress
+from operator import attrgetter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from io import BytesIO
 from datetime import datetime
-from PIL import Image, ImageTk
+
+# 起動時間の計測の基準（PyQt5などを読み込む前の時刻）
+STARTUP_STARTED = time.perf_counter()
+
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                             QHBoxLayout, QTableWidget, QTableWidgetItem,
+                             QHBoxLayout, QTableView, QStyledItemDelegate,
+                             QStyleOptionButton, QStyle,
                              QLabel, QComboBox, QLineEdit, QPushButton,
                              QHeaderView, QAbstractItemView, QFrame,
                              QSplitter, QScrollArea, QGridLayout, QFileDialog,
                              QMessageBox, QProgressDialog, QMenu)
-from PyQt5.QtCore import Qt, QUrl, QSize
-from PyQt5.QtGui import QPixmap, QIcon, QFont
-from PyQt5.QtPrintSupport import QPrinter
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as ReportLabImage
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import mm, cm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
+from PyQt5.QtCore import (Qt, QUrl, QSize, QObject, QByteArray, QBuffer, QEvent, QTimer,
+                          QAbstractTableModel, QModelIndex, pyqtSignal)
+from PyQt5.QtGui import QPixmap, QIcon, QFont, QImage
+# ReportLabとPILはPDF出力や画像の代替読み込みで初めて必要になるため、使う関数の中で読み込む
+# （起動時に読み込むのは単位の定義だけ）
+from reportlab.lib.units import mm
+
+# 漢字の名前を読みがなで並べ替えるために使う（任意。なければ表記のまま並べる）
+try:
+    import pykakasi
+except ImportError:
+    pykakasi = None
+
+
+# フォント設定ファイルパス
+FONT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "font_config.txt")
+
+# フォントの文字幅の表（JSON）のキャッシュの保存先
+FONT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "font_cache")
+FONT_CACHE_VERSION = 2
+
+# 解析済みの名簿（スナップショット）の保存先
+ROSTER_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "roster_cache")
+
+# 一覧表示用サムネイルの一辺のサイズ（px）
+THUMBNAIL_SIZE = 64
+
+# ディスク画像キャッシュの保存先と上限サイズ
+IMAGE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "image_cache")
+IMAGE_CACHE_MAX_BYTES = 500 * 1024 * 1024
+
+# ディスクキャッシュの画像をサーバーに再検証するまでの期間（秒）
+IMAGE_REVALIDATE_AFTER = 7 * 24 * 60 * 60
+
+# メモリ上のサムネイルキャッシュの上限サイズ
+THUMBNAIL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+# GoogleドライブのURLからファイルIDを取り出すパターン（上から順に試し、最初に見つかったものを使う）
+DRIVE_FILE_ID_PATTERNS = (
+    re.compile(r'open\?id=([^&]*)'),  # 'open?id=' パターン
+    re.compile(r'file/d/([^/]*)'),  # 'file/d/' パターン
+    re.compile(r'id=([^&]*)'),  # 'id=' パターン
+)
+
+# その他のURLやIDだけの場合（GoogleドライブのIDは通常25-33文字の英数字とハイフン）
+DRIVE_BARE_FILE_ID_PATTERN = re.compile(r'[-\w]{25,}')
+
+# URLごとに記憶しておくファイルIDの件数
+DRIVE_FILE_ID_CACHE_SIZE = 1 << 18
+
+
+@functools.lru_cache(maxsize=DRIVE_FILE_ID_CACHE_SIZE)
+def extract_google_drive_file_id(url):
+    """GoogleドライブのURLからファイルIDを抽出する（見つからない場合はNone）
+
+    表の再描画・サムネイル・PDFのカードで同じURLを何度も調べるため、結果はURLごとに記憶する。
+    """
+    if not url:
+        return None
+
+    for pattern in DRIVE_FILE_ID_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return match.group(1) or None
+
+    match = DRIVE_BARE_FILE_ID_PATTERN.search(url)
+    return match.group(0) if match else None
+
+
+# 画像取得で試すURLのパターン（{file_id}をファイルIDで置き換える）
+IMAGE_URL_PATTERNS = [
+    "https://lh3.googleusercontent.com/d/{file_id}",
+    "https://drive.usercontent.google.com/download?id={file_id}&export=view",
+    "https://drive.google.com/uc?export=view&id={file_id}",
+    "https://drive.google.com/uc?id={file_id}",
+    "https://drive.google.com/thumbnail?id={file_id}&sz=w2000",
+]
+
+
+def drive_candidate_urls(file_id, url_patterns=IMAGE_URL_PATTERNS):
+    """ファイルIDから、画像を取得できるURLの候補をurl_patternsの順に返す"""
+    return [pattern.format(file_id=file_id) for pattern in url_patterns]
+
+
+# 画像取得で試すリクエストヘッダーのセット
+IMAGE_REQUEST_HEADERS = [
+    {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+        'Referer': 'https://drive.google.com/'
+    },
+    {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.1 Safari/605.1.15',
+        'Accept': 'image/webp,image/png,image/svg+xml,image/*;q=0.8',
+        'Sec-Fetch-Site': 'cross-site',
+        'Sec-Fetch-Mode': 'no-cors',
+        'Sec-Fetch-Dest': 'image'
+    }
+]
+
+# 再試行しても結果が変わらないHTTPステータス
+# 404/410はファイル自体がないためURLパターンごと諦め、それ以外は組み合わせ単位で諦める
+MISSING_HTTP_STATUSES = {404, 410}
+PERMANENT_HTTP_STATUSES = {400, 401, 403, 405, 406, 414, 415, 451}
+
+
+class HttpConnectionPool:
+    """ホストごとに接続を使い回すHTTP(S)クライアント（keep-alive）
+
+    リクエストごとにTCP/TLS接続を張り直さないよう、(スキーム, ホスト, ポート)
+    ごとに待機中の接続を保持する。http/httpsのどちらにも対応するため、
+    ローカルのHTTPサーバーに対しても同じように動作する。
+    環境変数（HTTP_PROXY/HTTPS_PROXY/NO_PROXY）などのプロキシ設定に従い、
+    httpはプロキシに完全なURLを送り、httpsはCONNECTでトンネルを張って接続する。
+    """
+
+    REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+    def __init__(self, timeout=15, max_idle_per_host=8, max_redirects=5):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self.max_redirects = max_redirects
+        self.ssl_context = ssl.create_default_context()
+        self.lock = threading.Lock()
+
+        # スキーム -> プロキシのURL
+        self.proxies = urllib.request.getproxies()
+
+        # (スキーム, ホスト, ポート) -> 待機中の接続のリスト
+        self.idle = {}
+
+        # 統計（接続の再利用率の確認用）
+        self.connections_opened = 0
+        self.requests_sent = 0
+
+    def _proxy_for(self, scheme, host):
+        """ホストへの接続に使うプロキシの (ホスト, ポート, 認証ヘッダー) を返す（直接接続する場合はNone）"""
+        proxy_url = self.proxies.get(scheme)
+        if not proxy_url or urllib.request.proxy_bypass(host):
+            return None
+
+        parts = urllib.parse.urlsplit(proxy_url if '://' in proxy_url else f"http://{proxy_url}")
+        headers = {}
+        if parts.username:
+            credentials = f"{urllib.parse.unquote(parts.username)}:{urllib.parse.unquote(parts.password or '')}"
+            headers['Proxy-Authorization'] = "Basic " + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        return parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80), headers
+
+    def _acquire(self, key, proxy=None):
+        """待機中の接続を取り出す（なければ新しく作る）。(接続, 再利用かどうか)を返す"""
+        with self.lock:
+            connections = self.idle.get(key)
+            if connections:
+                return connections.pop(), True
+            self.connections_opened += 1
+
+        scheme, host, port = key
+        if proxy is not None:
+            proxy_host, proxy_port, proxy_headers = proxy
+            if scheme == 'https':
+                connection = http.client.HTTPSConnection(proxy_host, proxy_port, timeout=self.timeout,
+                                                         context=self.ssl_context)
+                connection.set_tunnel(host, port, headers=proxy_headers)
+            else:
+                connection = http.client.HTTPConnection(proxy_host, proxy_port, timeout=self.timeout)
+        elif scheme == 'https':
+            connection = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.ssl_context)
+        else:
+            connection = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        return connection, False
+
+    def _release(self, key, connection):
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.max_idle_per_host:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def close_all(self):
+        """待機中の接続をすべて閉じる"""
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def request(self, url, headers=None):
+        """GETリクエストを送り、(ステータス, レスポンスヘッダー, 本文)を返す
+
+        リダイレクトは追跡し、400以上のステータスはHTTPErrorとして送出する。
+        """
+        for _ in range(self.max_redirects + 1):
+            status, reason, response_headers, body = self._request_once(url, headers or {})
+
+            location = response_headers.get('Location')
+            if status in self.REDIRECT_STATUSES and location:
+                url = urllib.parse.urljoin(url, location)
+                continue
+
+            if status >= 400:
+                raise HTTPError(url, status, reason, response_headers, None)
+
+            return status, response_headers, body
+
+        raise URLError(f"リダイレクトが多すぎます: {url}")
+
+    def _request_once(self, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ('http', 'https'):
+            raise URLError(f"未対応のスキームです: {url}")
+
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == 'https' else 80))
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+
+        proxy = self._proxy_for(scheme, parts.hostname)
+        if proxy is not None and scheme == 'http':
+            # httpのプロキシには、リクエスト行に完全なURLを送る
+            path = f"{scheme}://{parts.netloc}{path}"
+            headers = dict(headers, **proxy[2])
+
+        for attempt in range(2):
+            connection, reused = self._acquire(key, proxy)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError) as e:
+                connection.close()
+                # サーバー側で切断済みだった待機中の接続は、一度だけ作り直して再送する
+                if reused and attempt == 0:
+                    continue
+                raise URLError(e)
+            except Exception:
+                connection.close()
+                raise
+
+            with self.lock:
+                self.requests_sent += 1
+
+            if response.will_close:
+                connection.close()
+            else:
+                self._release(key, connection)
+
+            return response.status, response.reason, response.headers, body
+
+
+class ImageFetcher:
+    """URLパターンとヘッダーの組み合わせを試して画像を取得する
+
+    最後に成功した組み合わせを最初に試し、ホストごとに指数バックオフ
+    （ジッター付き）で待機する。404などの恒久的なエラーでは待機せずに
+    次の組み合わせへ進み、一時的なエラーがなければ再試行もしない。
+    1件あたりの取得はmax_total_time秒で打ち切る。
+    通信は接続を使い回すHttpConnectionPoolで行い、ETag/Last-Modifiedが
+    分かっている場合は条件付きリクエストで再検証する。
+    """
+
+    def __init__(self, url_patterns=IMAGE_URL_PATTERNS, headers_list=IMAGE_REQUEST_HEADERS,
+                 timeout=15, base_delay=0.25, max_delay=4.0, max_total_time=20.0):
+        self.url_patterns = list(url_patterns)
+        self.headers_list = list(headers_list)
+        self.timeout = timeout
+        self.pool = HttpConnectionPool(timeout=timeout)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_total_time = max_total_time
+        self.lock = threading.Lock()
+
+        # 最後に成功した (URLパターン番号, ヘッダー番号)
+        self.preferred = None
+
+        # ホスト -> 連続失敗回数 / 次にリクエストしてよい時刻
+        self.host_failures = {}
+        self.host_next_time = {}
+
+    def attempt_order(self):
+        """試す (URLパターン番号, ヘッダー番号) の順序を返す（前回の成功を先頭に）"""
+        combos = [(pattern_index, headers_index)
+                  for pattern_index in range(len(self.url_patterns))
+                  for headers_index in range(len(self.headers_list))]
+        with self.lock:
+            preferred = self.preferred
+        if preferred in combos:
+            combos.remove(preferred)
+            combos.insert(0, preferred)
+        return combos
+
+    def wait_for_host(self, host):
+        """ホストのバックオフ期間が終わるまで待機する"""
+        with self.lock:
+            delay = self.host_next_time.get(host, 0) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def record_failure(self, host):
+        """一時的な失敗を記録し、次のリクエストまでの待機時間を延ばす"""
+        with self.lock:
+            failures = self.host_failures.get(host, 0) + 1
+            self.host_failures[host] = failures
+            # フルジッター: 0〜(base × 2^(n-1)) の一様乱数（上限max_delay）
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (failures - 1))))
+            self.host_next_time[host] = time.monotonic() + delay
+
+    def record_success(self, host, combo):
+        with self.lock:
+            self.host_failures.pop(host, None)
+            self.host_next_time.pop(host, None)
+            self.preferred = combo
+
+    def request(self, target_url, headers):
+        """1回分のリクエストを行い、(ステータス, レスポンスヘッダー, 本文)を返す"""
+        return self.pool.request(target_url, headers)
+
+    def fetch(self, url, max_retries=3):
+        """画像データを取得する（失敗した場合はNone）"""
+        result, image_data, _ = self.fetch_conditional(url, max_retries=max_retries)
+        return image_data if result == 'ok' else None
+
+    def fetch_conditional(self, url, etag=None, last_modified=None, max_retries=3):
+        """条件付きで画像を取得し、(結果, 画像データ, 検証子)を返す
+
+        結果は 'ok'（取得した）、'not_modified'（304: 手元のデータが最新）、
+        'failed'（取得できなかった）のいずれか。検証子はETag/Last-Modifiedの辞書。
+        """
+        file_id = extract_google_drive_file_id(url)
+
+        if not file_id:
+            print(f"警告: GoogleドライブのファイルIDを抽出できませんでした: {url}")
+            return 'failed', None, {}
+
+        # 取得先の候補（attempt_orderで並べ替えた番号の順に試す）
+        candidate_urls = drive_candidate_urls(file_id, self.url_patterns)
+
+        conditional_headers = {}
+        if etag:
+            conditional_headers['If-None-Match'] = etag
+        if last_modified:
+            conditional_headers['If-Modified-Since'] = last_modified
+
+        deadline = time.monotonic() + self.max_total_time
+
+        # 恒久的に失敗したURLパターン / 組み合わせ
+        dead_patterns = set()
+        dead_combos = set()
+
+        for retry in range(max_retries):
+            transient_failure = False
+
+            # 一時的なエラーが出たパターンは、この周回では別のヘッダーで試さない
+            busy_patterns = set()
+
+            for combo in self.attempt_order():
+                pattern_index, headers_index = combo
+                if pattern_index in dead_patterns or pattern_index in busy_patterns or combo in dead_combos:
+                    continue
+
+                if time.monotonic() >= deadline:
+                    print(f"取得時間の上限に達しました: {url}")
+                    return 'failed', None, {}
+
+                target_url = candidate_urls[pattern_index]
+                host = urllib.parse.urlsplit(target_url).netloc
+                self.wait_for_host(host)
+
+                try:
+                    headers = dict(self.headers_list[headers_index], **conditional_headers)
+                    status, response_headers, image_data = self.request(target_url, headers)
+                    validators = {
+                        'etag': response_headers.get('ETag'),
+                        'last_modified': response_headers.get('Last-Modified'),
+                    }
+
+                    if status == 304:
+                        self.record_success(host, combo)
+                        print(f"更新なし: {target_url}")
+                        return 'not_modified', None, validators
+
+                    if image_data and len(image_data) > 100:  # 最小サイズチェック
+                        self.record_success(host, combo)
+                        print(f"成功: {target_url} (試行 {retry+1}/{max_retries})")
+                        return 'ok', image_data, validators
+
+                    print(f"画像データが不十分: {target_url}")
+                    dead_combos.add(combo)
+                except HTTPError as e:
+                    print(f"失敗 ({e}): {target_url}")
+                    if e.code in MISSING_HTTP_STATUSES:
+                        dead_patterns.add(pattern_index)
+                    elif e.code in PERMANENT_HTTP_STATUSES:
+                        dead_combos.add(combo)
+                    else:
+                        # 429や5xxなどはホストの負荷とみなしてバックオフ
+                        self.record_failure(host)
+                        busy_patterns.add(pattern_index)
+                        transient_failure = True
+                except (URLError, OSError) as e:
+                    print(f"失敗 ({e}): {target_url}")
+                    self.record_failure(host)
+                    busy_patterns.add(pattern_index)
+                    transient_failure = True
+                except Exception as e:
+                    print(f"例外: {e} for {target_url}")
+                    self.record_failure(host)
+                    busy_patterns.add(pattern_index)
+                    transient_failure = True
+
+            # 一時的なエラーがなければ、再試行しても結果は変わらない
+            if not transient_failure:
+                break
+
+        print(f"すべての試行が失敗しました: {url}")
+        return 'failed', None, {}
+
+
+def image_cache_key(url):
+    """画像キャッシュのキーを返す（ファイルIDが取れないURLはURLのハッシュを使う）"""
+    file_id = extract_google_drive_file_id(url)
+    if file_id:
+        return file_id
+    return "url-" + hashlib.sha1(url.strip().encode('utf-8')).hexdigest()
+
+
+class ImageDiskCache:
+    """ファイルIDをキーにした内容アドレス方式のディスク画像キャッシュ
+
+    元画像は内容のSHA-256で objects/ 以下に保存し、ids/ にはファイルIDから
+    ハッシュへの対応を保存する。縮小済みの派生画像は元画像と同じ場所に
+    "<ハッシュ>.<派生名>" として保存する。上限サイズを超えた場合は最終
+    アクセス日時（mtime）の古いものから削除する。状態はすべてファイルとして
+    持つため、複数のスレッドやプロセスから同時に使用できる。
+    """
+
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.ids_dir = os.path.join(cache_dir, "ids")
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.ids_dir, exist_ok=True)
+
+        # 現在の使用量（起動を遅らせないよう最初の書き込み時に一度だけ走査し、
+        # 以降は書き込みごとに加算）
+        self.total_bytes = None
+
+    def _object_path(self, content_hash, variant=None):
+        name = content_hash if not variant else f"{content_hash}.{variant}"
+        return os.path.join(self.objects_dir, content_hash[:2], name)
+
+    def _id_path(self, key):
+        safe_key = re.sub(r'[^-\w]', '_', key)
+        return os.path.join(self.ids_dir, f"{safe_key}.json")
+
+    def _scan_objects(self):
+        """(パス, mtime, サイズ) を列挙する"""
+        for root, _, files in os.walk(self.objects_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        # LRU用に最終アクセス日時を更新
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def lookup(self, key):
+        """キーに対応する元画像のメタデータを返す（未登録の場合はNone）"""
+        try:
+            with open(self._id_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def content_hash(self, key):
+        """キーに対応する元画像のハッシュを返す（未登録の場合はNone）"""
+        entry = self.lookup(key)
+        return entry.get('sha256') if entry else None
+
+    def get(self, key):
+        """元画像のバイト列を返す（キャッシュにない場合はNone）"""
+        content_hash = self.content_hash(key)
+        if not content_hash:
+            return None
+        return self._read(self._object_path(content_hash))
+
+    def put(self, key, data, **metadata):
+        """元画像を保存し、内容のハッシュを返す"""
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self._object_path(content_hash)
+
+        if not os.path.exists(path):
+            self._write_atomic(path, data)
+            self._add_bytes(len(data))
+
+        entry = dict(metadata, sha256=content_hash, size=len(data), stored_at=time.time())
+        self._write_atomic(self._id_path(key), json.dumps(entry).encode('utf-8'))
+        return content_hash
+
+    def refresh(self, key, **metadata):
+        """再検証で更新がなかったエントリの保存日時とメタデータを更新する"""
+        entry = self.lookup(key)
+        if not entry:
+            return
+        entry.update(metadata, stored_at=time.time())
+        self._write_atomic(self._id_path(key), json.dumps(entry).encode('utf-8'))
+
+    def has_object(self, content_hash):
+        """元画像のファイルがあるかどうか（内容は読み込まない）"""
+        return os.path.exists(self._object_path(content_hash))
+
+    def get_variant(self, key, variant):
+        """縮小済みの派生画像を返す（キャッシュにない場合はNone）"""
+        content_hash = self.content_hash(key)
+        if not content_hash:
+            return None
+        return self._read(self._object_path(content_hash, variant))
+
+    def put_variant(self, key, variant, data):
+        """縮小済みの派生画像を保存する（元画像が未登録の場合は何もしない）"""
+        content_hash = self.content_hash(key)
+        if not content_hash:
+            return
+        path = self._object_path(content_hash, variant)
+        self._write_atomic(path, data)
+        self._add_bytes(len(data))
+
+    def _add_bytes(self, size):
+        with self.lock:
+            if self.total_bytes is None:
+                # 走査結果には書き込んだばかりのファイルも含まれる
+                self.total_bytes = sum(object_size for _, _, object_size in self._scan_objects())
+            else:
+                self.total_bytes += size
+            if self.total_bytes <= self.max_bytes:
+                return
+            self._evict()
+
+    def _evict(self):
+        """上限の9割まで、最終アクセス日時の古いファイルから削除する"""
+        entries = sorted(self._scan_objects(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * 0.9
+
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+
+        # 元画像が削除されたキーは、次回のgetで見つからずに再取得される
+        self.total_bytes = total
+        print(f"画像キャッシュを整理しました: {total / (1024 * 1024):.1f}MB")
+
+
+class ImageLoader:
+    """ディスクキャッシュとネットワークを組み合わせて画像データを取得する"""
+
+    def __init__(self, disk_cache, fetcher):
+        self.disk_cache = disk_cache
+        self.fetcher = fetcher
+
+    def get(self, url):
+        """画像データを取得する（ディスクキャッシュにあればネットワークを使わない）"""
+        if not url or not url.strip():
+            return None
+
+        key = image_cache_key(url)
+        entry = self.disk_cache.lookup(key)
+        image_data = self.disk_cache.get(key) if entry else None
+
+        if image_data is not None:
+            if time.time() - entry.get('stored_at', 0) < IMAGE_REVALIDATE_AFTER:
+                return image_data
+
+            # 古くなったキャッシュは条件付きリクエストで再検証する
+            result, new_data, validators = self.fetcher.fetch_conditional(
+                url, etag=entry.get('etag'), last_modified=entry.get('last_modified'))
+            try:
+                if result == 'not_modified':
+                    self.disk_cache.refresh(key, **validators)
+                elif result == 'ok':
+                    self.disk_cache.put(key, new_data, url=url, **validators)
+                    return new_data
+            except Exception as e:
+                print(f"画像キャッシュ保存エラー: {e}")
+            # 更新なし、または取得に失敗した場合は手元のデータを使う
+            return image_data
+
+        result, image_data, validators = self.fetcher.fetch_conditional(url)
+        if result != 'ok':
+            return None
+
+        try:
+            self.disk_cache.put(key, image_data, url=url, **validators)
+        except Exception as e:
+            print(f"画像キャッシュ保存エラー: {e}")
+        return image_data
+
+    def known_content_hash(self, url):
+        """キャッシュが再検証の期限内であれば、記録済みの内容のハッシュを返す（なければNone）
+
+        画像の読み込みや取得はしない。
+        """
+        if not url or not url.strip():
+            return None
+
+        entry = self.disk_cache.lookup(image_cache_key(url))
+        if entry and entry.get('sha256') and time.time() - entry.get('stored_at', 0) < IMAGE_REVALIDATE_AFTER:
+            return entry['sha256']
+        return None
+
+    def get_cached(self, url):
+        """ディスクキャッシュにある画像データを返す（ネットワークは使わず、なければNone）
+
+        再検証の期限は見ない。先読みで取得済みの写真だけでPDFをレイアウトするために使う。
+        """
+        if not url or not url.strip():
+            return None
+        return self.disk_cache.get(image_cache_key(url))
+
+    def cached_content_hash(self, url):
+        """get_cached(url)が返す画像の内容のハッシュを返す（元画像がなければNone）
+
+        記録済みのハッシュを返し、画像の読み込みや取得はしない。
+        """
+        if not url or not url.strip():
+            return None
+
+        content_hash = self.disk_cache.content_hash(image_cache_key(url))
+        if content_hash and self.disk_cache.has_object(content_hash):
+            return content_hash
+        return None
+
+    def is_cached(self, url):
+        """ネットワークを使わずにキャッシュの画像を使えるか（内容は読み込まずに調べる）
+
+        ハッシュの記録が残っていても、容量の上限で元画像が削除されていればFalse。
+        """
+        content_hash = self.known_content_hash(url)
+        return content_hash is not None and self.disk_cache.has_object(content_hash)
+
+
+def decode_thumbnail(image_data, size=THUMBNAIL_SIZE):
+    """画像データをサムネイル用のQImageに変換する（ワーカースレッドから呼び出し可能）"""
+    # ----- QImageでロード -----
+    image = QImage()
+    loaded = image.loadFromData(QByteArray(image_data))
+
+    if loaded and not image.isNull():
+        return image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+    # ----- 代替手段: PILで形式を判定し、形式を指定して読み込む -----
+    from PIL import Image
+
+    try:
+        with Image.open(BytesIO(image_data)) as pil_image:
+            img_format = pil_image.format
+
+        if img_format and image.loadFromData(QByteArray(image_data), img_format.upper()):
+            return image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    except Exception as pil_err:
+        print(f"PILでの画像形式検出エラー: {pil_err}")
+
+    # ----- 代替手段2: PILでデコードした画素データから作成 -----
+    try:
+        with Image.open(BytesIO(image_data)) as pil_image:
+            # 先に縮小してから変換することで、コピーする画素データを減らす
+            pil_image.thumbnail((size, size), Image.LANCZOS)
+            rgba_image = pil_image.convert("RGBA")
+
+        width, height = rgba_image.size
+        pixels = rgba_image.tobytes()
+
+        # RGBA形式のQImageを作成（バッファの寿命に依存しないようコピーする）
+        image = QImage(pixels, width, height, width * 4, QImage.Format_RGBA8888).copy()
+
+        if not image.isNull():
+            return image
+
+    except Exception as pil_err:
+        print(f"PIL変換エラー: {pil_err}")
+
+    # すべての方法が失敗した場合
+    return QImage()
+
+
+def estimate_pixmap_bytes(pixmap):
+    """QPixmap/QImageが占有するおおよそのバイト数を返す"""
+    return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+
+class ThumbnailMemoryCache:
+    """推定バイト数で上限を管理するLRU方式のサムネイルキャッシュ"""
+
+    def __init__(self, max_bytes=THUMBNAIL_CACHE_MAX_BYTES, sizeof=estimate_pixmap_bytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()  # キー -> (値, バイト数)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """値を返し、最近使用したものとして扱う"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        """値を追加し、上限を超えた分を古いものから削除する"""
+        self.discard(key)
+        size = self.sizeof(value)
+        self.entries[key] = (value, size)
+        self.total_bytes += size
+
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, old_size) = self.entries.popitem(last=False)
+            self.total_bytes -= old_size
+            self.evictions += 1
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[1]
+
+    def retain(self, keys):
+        """指定したキー以外をすべて削除し、削除した件数を返す"""
+        keep = set(keys)
+        removed = [key for key in self.entries if key not in keep]
+        for key in removed:
+            self.discard(key)
+        return len(removed)
+
+    def clear(self):
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def stats(self):
+        """ヒット数・ミス数などの統計を返す"""
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class ImagePrefetcher(QObject):
+    """写真をバックグラウンドで先読みし、完了ごとにサムネイルをシグナルで通知する"""
+
+    # (url, サムネイル) ― 取得・変換に失敗した場合は空のQImage
+    thumbnail_ready = pyqtSignal(str, QImage)
+
+    def __init__(self, load_func, max_workers=4, parent=None):
+        super().__init__(parent)
+        # URLを受け取りサムネイルのQImageを返す関数（ワーカースレッドで実行）
+        self.load_func = load_func
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-prefetch")
+
+        # 取得中または待機中のURL -> Future
+        self.pending = {}
+
+        # 完了通知はGUIスレッドで受け取り、待機中リストから外す
+        self.thumbnail_ready.connect(self._on_thumbnail_ready)
+
+    def prefetch(self, urls):
+        """URLの一覧を取得キューに追加する（取得中のURLは重複して追加しない）"""
+        for url in urls:
+            if not url or not url.strip() or url in self.pending:
+                continue
+            self.pending[url] = self.executor.submit(self._load, url)
+
+    def cancel_all(self):
+        """まだ開始していない取得をすべて取り消す"""
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+
+    def shutdown(self):
+        """スレッドプールを停止する"""
+        self.cancel_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _load(self, url):
+        # ワーカースレッドで実行される
+        image = QImage()
+        try:
+            image = self.load_func(url)
+        except Exception as e:
+            print(f"画像先読みエラー: {e} for URL: {url}")
+        self.thumbnail_ready.emit(url, image)
+
+    def _on_thumbnail_ready(self, url, image):
+        self.pending.pop(url, None)
+
+
+# CSVの列名（アンケートの質問）と内部のキーの対応
+CSV_COLUMN_MAPPING = {
+    'parent_name': '回答者のお名前',
+    'child_name': 'お子様のお名前',
+    'grade': 'お子様の学年',
+    'child_phrase': '高等部二年生保護者の皆様へご挨拶',
+    'parent_phrase': 'お住まいの地域',
+    'photo_url': 'お子様と回答者の写真',
+}
+
+# CSVを読み込む際に、まとめて表に追加する行数
+CSV_CHUNK_ROWS = 2000
+
+
+class MemberRecord:
+    """会員1人分のデータ
+
+    行ごとの辞書の代わりに__slots__で項目を持つ。member_idは読み込み順の
+    通し番号（self.dataでの位置）で、絞り込み・並べ替えはこの番号で行う。
+    学年は同じ文字列を共有するようinternし、検索用の小文字テキストと
+    写真のGoogleドライブのファイルIDは作成時に一度だけ求める。
+    """
+
+    FIELDS = tuple(CSV_COLUMN_MAPPING)
+    SEARCH_FIELDS = ('parent_name', 'child_name', 'child_phrase', 'parent_phrase')
+
+    __slots__ = ('member_id',) + FIELDS + ('search_text', 'photo_file_id')
+
+    def __init__(self, member_id, parent_name='', child_name='', grade='',
+                 child_phrase='', parent_phrase='', photo_url=''):
+        self.member_id = member_id
+        self.parent_name = parent_name
+        self.child_name = child_name
+        self.grade = sys.intern(grade)
+        self.child_phrase = child_phrase
+        self.parent_phrase = parent_phrase
+        self.photo_url = photo_url
+
+        # 項目をまたいで一致しないよう、検索語に現れない文字で区切る（SEARCH_FIELDSの順）
+        self.search_text = "\x00".join((parent_name, child_name, child_phrase, parent_phrase)).lower()
+        self.photo_file_id = extract_google_drive_file_id(photo_url)
+
+    @classmethod
+    def from_csv_row(cls, member_id, row, columns=tuple(CSV_COLUMN_MAPPING.values())):
+        """CSVの行（列名 -> 値）からレコードを作る"""
+        return cls(member_id, *[row.get(column) or '' for column in columns])
+
+    def __getstate__(self):
+        # 検索用テキストも含める（ワーカープロセスに渡す際に作り直さずに済む）
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __setstate__(self, state):
+        (self.member_id, self.parent_name, self.child_name, self.grade,
+         self.child_phrase, self.parent_phrase, self.photo_url, self.search_text, self.photo_file_id) = state
+
+    def __repr__(self):
+        return f"MemberRecord({self.member_id}, {self.parent_name!r}, {self.grade!r})"
+
+
+def iter_member_csv_chunks(filename, chunk_size=CSV_CHUNK_ROWS):
+    """CSVファイルを少しずつ読み込み、(MemberRecordのリスト, 読み込み済みバイト数) を順に返す
+
+    1行ずつMemberRecordに変換し、元の行の辞書はすぐに手放すため、
+    大きなファイルでもCSVの行と会員データを二重に抱えることはない。
+    """
+    with open(filename, 'r', encoding='utf-8') as f:
+        csv_reader = csv.DictReader(f)
+        chunk = []
+        for member_id, row in enumerate(csv_reader):
+            chunk.append(MemberRecord.from_csv_row(member_id, row))
+            if len(chunk) >= chunk_size:
+                yield chunk, f.buffer.tell()
+                chunk = []
+        yield chunk, f.buffer.tell()
+
+
+def read_member_csv(filename):
+    """CSVファイルを読み込み、MemberRecordのリストを返す"""
+    items = []
+    for chunk, _ in iter_member_csv_chunks(filename):
+        items.extend(chunk)
+    return items
+
+
+class MemberSearchIndex:
+    """会員データの部分一致検索用インデックス
+
+    検索対象の4項目を小文字化して連結したテキストから、長さ1〜3のn-gram
+    ごとに会員ID（self.dataでの位置）の昇順のarray('i')を作る。会員は
+    IDの昇順に追加されるため、末尾と同じIDを飛ばして追加するだけで重複の
+    ない昇順の列になる（集合よりはるかに小さい）。3文字以下の検索語は
+    n-gramの列がそのまま答えになり、それより長い検索語は最も件数の
+    少ないトライグラムで候補を絞ってから部分一致を確認する。直前の検索語を
+    含む検索語（1文字追加した場合など）は、直前の結果だけを確認して絞り込む。
+    学年ごとの会員IDも保持するため、学年フィルターは辞書の参照だけで済む。
+    """
+
+    MAX_NGRAM = 3
+
+    def __init__(self, items=()):
+        self.texts = []      # 会員ID -> 検索用テキスト
+        self.grades = []     # 会員ID -> 学年
+        self.postings = {}   # n-gram -> 会員IDの昇順のarray
+        self.grade_ids = {}  # 学年 -> 会員IDのリスト
+
+        # 直前の検索（語, 学年, 結果のIDリスト）
+        self.last_search = None
+
+        for item in items:
+            self.add(item)
+
+    def posting_columns(self):
+        """保存用に (n-gramのリスト, 区切り位置のarray, 全n-gramの会員IDを昇順で連結したarray) を返す"""
+        grams = list(self.postings)
+        offsets = array('i', [0])
+        ids = array('i')
+        for gram in grams:
+            ids.extend(self.postings[gram])
+            offsets.append(len(ids))
+        return grams, offsets, ids
+
+    @classmethod
+    def restore(cls, items, grams, offsets, ids):
+        """会員データと posting_columns() の値からインデックスを復元する"""
+        index = cls()
+        index.texts = [item.search_text for item in items]
+        index.grades = [item.grade for item in items]
+        for member_id, grade in enumerate(index.grades):
+            index.grade_ids.setdefault(grade, []).append(member_id)
+        index.postings = {gram: ids[offsets[i]:offsets[i + 1]] for i, gram in enumerate(grams)}
+        return index
+
+    @staticmethod
+    def normalize(text):
+        return (text or '').lower()
+
+    def add(self, item):
+        """会員（MemberRecord）を追加し、その会員IDを返す"""
+        member_id = len(self.texts)
+
+        # 検索用テキストはレコードのものを共有する
+        text = item.search_text
+        self.texts.append(text)
+        self.grades.append(item.grade)
+        self.grade_ids.setdefault(item.grade, []).append(member_id)
+
+        postings = self.postings
+        for part in text.split("\x00"):
+            for n in range(1, self.MAX_NGRAM + 1):
+                for start in range(len(part) - n + 1):
+                    gram = part[start:start + n]
+                    ids = postings.get(gram)
+                    if ids is None:
+                        postings[gram] = array('i', (member_id,))
+                    elif ids[-1] != member_id:
+                        # 同じ会員の中で同じn-gramが繰り返し出てきた場合は追加しない
+                        ids.append(member_id)
+
+        self.last_search = None
+        return member_id
+
+    def search(self, query, grade=None):
+        """検索語と学年（Noneはすべて）に一致する会員IDを昇順で返す"""
+        query = self.normalize(query)
+
+        if not query:
+            if grade is None:
+                return list(range(len(self.texts)))
+            return list(self.grade_ids.get(grade, []))
+
+        previous = self.last_search
+        if previous and previous[1] == grade and previous[0] in query:
+            # 直前の結果を絞り込む
+            ids = [member_id for member_id in previous[2] if query in self.texts[member_id]]
+        else:
+            ids = self._search_index(query)
+            if grade is not None:
+                ids = [member_id for member_id in ids if self.grades[member_id] == grade]
+
+        self.last_search = (query, grade, ids)
+        return ids
+
+    def _search_index(self, query):
+        if len(query) <= self.MAX_NGRAM:
+            return list(self.postings.get(query, ()))
+
+        # 最も件数の少ないトライグラムを候補にし、部分一致を確認する
+        n = self.MAX_NGRAM
+        grams = {query[start:start + n] for start in range(len(query) - n + 1)}
+        candidates = min((self.postings.get(gram, ()) for gram in grams), key=len)
+        return [member_id for member_id in candidates if query in self.texts[member_id]]
+
+
+# 並べ替え可能な列番号 -> 会員データのキー
+SORT_COLUMN_KEYS = {
+    2: 'parent_name',
+    3: 'child_name',
+    4: 'grade',
+}
+
+# カタカナ -> ひらがな（読みのかな種別の違いをそろえる）
+KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+
+_kakasi = None
+
+
+def kana_reading(text):
+    """文字列の読みがなを返す（pykakasiがなければ文字列をそのまま返す）"""
+    global _kakasi
+    if pykakasi is None:
+        return text
+    if _kakasi is None:
+        _kakasi = pykakasi.kakasi()
+    return "".join(part['hira'] for part in _kakasi.convert(text))
+
+
+def collation_key(text):
+    """名前の並べ替えに使うキー（読みがな・かな種別・全角半角・大文字小文字の違いをそろえる）"""
+    normalized = unicodedata.normalize('NFKC', text or '')
+    reading = kana_reading(normalized).translate(KATAKANA_TO_HIRAGANA).casefold()
+    # 読みが同じ場合は表記で順序を決める（\x00はどの文字よりも前に並ぶ）
+    return f"{reading}\x00{normalized}"
+
+
+class MemberSortRanks:
+    """並べ替え可能な列ごとの会員IDの並び順
+
+    読み込み時に列ごとに一度だけ照合キー（collation_key）で並べ、昇順の
+    会員IDの配列（orders）と、会員ID -> 順位の配列（ranks）を作っておく。
+    絞り込み結果の並べ替えは、件数が少なければ順位の整数比較、多ければ
+    昇順の配列から該当する会員を拾うだけで済み、文字列は比較し直さない。
+    降順は昇順を逆にしたもの。
+    """
+
+    def __init__(self, items=()):
+        self.size = len(items)
+        self.orders = {}  # 列番号 -> 昇順に並べた会員ID
+        self.ranks = {}   # 列番号 -> 会員IDごとの順位
+
+        for column, field in SORT_COLUMN_KEYS.items():
+            keys = self.collation_keys(getattr(item, field) for item in items)
+            order = array('i', sorted(range(self.size), key=keys.__getitem__))
+            ranks = array('i', bytes(order.itemsize * self.size))
+            for rank, member_id in enumerate(order):
+                ranks[member_id] = rank
+            self.orders[column] = order
+            self.ranks[column] = ranks
+
+    @classmethod
+    def restore(cls, size, orders, ranks):
+        """保存した列ごとの並び順と順位（列番号 -> array）から復元する"""
+        sort_ranks = cls()
+        sort_ranks.size = size
+        sort_ranks.orders = orders
+        sort_ranks.ranks = ranks
+        return sort_ranks
+
+    @staticmethod
+    def collation_keys(values):
+        """値ごとの照合キーのリストを返す（同じ値のキーは一度だけ計算する）"""
+        cache = {}
+        keys = []
+        for value in values:
+            key = cache.get(value)
+            if key is None:
+                key = cache[value] = collation_key(value)
+            keys.append(key)
+        return keys
+
+    def sort(self, member_ids, column, descending=False):
+        """会員IDを指定された列の順に並べた新しいリストを返す"""
+        order = self.orders.get(column)
+        if order is None:
+            return list(member_ids)
+
+        if len(member_ids) * 4 >= self.size:
+            # 多くの会員が残っている場合は、昇順の配列を一度走査する
+            selected = bytearray(self.size)
+            for member_id in member_ids:
+                selected[member_id] = 1
+            result = list(compress(order, map(selected.__getitem__, order)))
+        else:
+            result = sorted(member_ids, key=self.ranks[column].__getitem__)
+
+        if descending:
+            result.reverse()
+        return result
+
+
+# 新しく作るファイルの既定の権限（umaskを適用した0666）
+# umaskは変更しないと読めないため、スレッドが動き出す前の読み込み時に一度だけ調べる
+_PROCESS_UMASK = os.umask(0)
+os.umask(_PROCESS_UMASK)
+DEFAULT_FILE_MODE = 0o666 & ~_PROCESS_UMASK
+
+
+def write_file_atomic(path, *chunks):
+    """一時ファイルに書き込んでから置き換える（途中で失敗しても元のファイルは壊れない）
+
+    mkstempの一時ファイルは所有者だけが読める権限で作られるため、置き換える前に
+    既存のファイル（なければ通常のファイル作成時）と同じ権限にそろえる。
+    """
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = DEFAULT_FILE_MODE
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+# 名簿のスナップショット（解析済みの会員データ・検索インデックス・並び順）の形式
+ROSTER_SNAPSHOT_MAGIC = b"P2PROSTR"
+ROSTER_SNAPSHOT_VERSION = 3
+
+
+def file_fingerprint(path):
+    """ファイルのサイズ・更新日時・SHA-256を返す"""
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+
+def roster_snapshot_path(csv_path, size, mtime_ns, cache_dir=ROSTER_CACHE_DIR):
+    """CSVのパス・サイズ・更新日時に対応するスナップショットのパスを返す
+
+    ファイル名は「CSVのパスのハッシュ-パス・サイズ・更新日時のハッシュ」で、
+    前半が同じものは同じCSVの古いスナップショット。
+    """
+    path = os.path.abspath(csv_path)
+    path_hash = hashlib.sha256(path.encode('utf-8')).hexdigest()[:32]
+    version_hash = hashlib.sha256(f"{path}\x00{size}\x00{mtime_ns}".encode('utf-8')).hexdigest()[:32]
+    return os.path.join(cache_dir, f"{path_hash}-{version_hash}.roster")
+
+
+def write_roster_snapshot(csv_path, fingerprint, items, index, ranks, cache_dir=ROSTER_CACHE_DIR):
+    """読み込み済みの会員データ・検索インデックス・並び順をキャッシュディレクトリに保存する
+
+    先頭にマジックとJSONのヘッダー（形式のバージョン・元のCSVの指紋・各区画の位置）、
+    その後に区画を順に置く。会員データとn-gramはJSON、会員IDの列はarray('i')の
+    バイト列で、実行可能なオブジェクトは含まない。
+    """
+    grams, offsets, ids = index.posting_columns()
+    records = [[getattr(item, field) for item in items] for field in MemberRecord.FIELDS]
+    sections = [
+        ('records', json.dumps(records, ensure_ascii=False).encode('utf-8')),
+        ('grams', json.dumps(grams, ensure_ascii=False).encode('utf-8')),
+        ('posting_offsets', offsets.tobytes()),
+        ('posting_ids', ids.tobytes()),
+    ]
+    for column in SORT_COLUMN_KEYS:
+        sections.append((f'order{column}', ranks.orders[column].tobytes()))
+        sections.append((f'rank{column}', ranks.ranks[column].tobytes()))
+
+    layout = {}
+    offset = 0
+    for name, data in sections:
+        layout[name] = [offset, len(data)]
+        offset += len(data)
+
+    header = json.dumps(dict(fingerprint, version=ROSTER_SNAPSHOT_VERSION, count=len(items),
+                             byteorder=sys.byteorder, itemsize=array('i').itemsize,
+                             sections=layout)).encode('utf-8')
+
+    snapshot_path = roster_snapshot_path(csv_path, fingerprint['size'], fingerprint['mtime_ns'], cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    write_file_atomic(snapshot_path, ROSTER_SNAPSHOT_MAGIC, struct.pack('>I', len(header)), header,
+                      *(data for _, data in sections))
+
+    # 同じCSVの古いスナップショットは使われないので削除する
+    snapshot_name = os.path.basename(snapshot_path)
+    prefix = snapshot_name.split('-', 1)[0] + '-'
+    for name in os.listdir(cache_dir):
+        if name.startswith(prefix) and name != snapshot_name:
+            try:
+                os.unlink(os.path.join(cache_dir, name))
+            except OSError:
+                pass
+    return snapshot_path
+
+
+def read_roster_snapshot(csv_path, cache_dir=ROSTER_CACHE_DIR):
+    """CSVに対応するスナップショットを読み込み、(会員データ, 検索インデックス, 並び順) を返す
+
+    スナップショットがない・形式が古い・CSVのSHA-256が保存時と異なる・区画の
+    大きさが会員数と合わない場合はNoneを返す。
+    """
+    try:
+        stat = os.stat(csv_path)
+        snapshot_path = roster_snapshot_path(csv_path, stat.st_size, stat.st_mtime_ns, cache_dir)
+        with open(snapshot_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            prefix = len(ROSTER_SNAPSHOT_MAGIC)
+            if view[:prefix] != ROSTER_SNAPSHOT_MAGIC:
+                return None
+            (header_size,) = struct.unpack('>I', view[prefix:prefix + 4])
+            header = json.loads(view[prefix + 4:prefix + 4 + header_size].decode('utf-8'))
+            if (header.get('version'), header.get('byteorder'), header.get('itemsize')) != (
+                    ROSTER_SNAPSHOT_VERSION, sys.byteorder, array('i').itemsize):
+                return None
+
+            # ファイル名がサイズと更新日時に対応しているので、残りは内容のハッシュだけ確かめる
+            if file_fingerprint(csv_path)['sha256'] != header.get('sha256'):
+                return None
+
+            body_start = prefix + 4 + header_size
+            count = header['count']
+
+            def section(name):
+                start, length = header['sections'][name]
+                return view[body_start + start:body_start + start + length]
+
+            def int_array(name):
+                values = array('i')
+                values.frombytes(section(name))
+                return values
+
+            def sort_column(name):
+                # 並び順と順位はどちらも 0〜会員数-1 の値が会員数ぶん並ぶ
+                values = int_array(name)
+                if len(values) != count or (values and (min(values) < 0 or max(values) >= count)):
+                    raise ValueError(f"{name}の内容が会員数と一致しません")
+                return values
+
+            records = json.loads(section('records'))
+            if len(records) != len(MemberRecord.FIELDS) or any(len(column) != count for column in records):
+                return None
+            items = [MemberRecord(member_id, *values) for member_id, values in enumerate(zip(*records))]
+
+            grams = json.loads(section('grams'))
+            offsets = int_array('posting_offsets')
+            ids = int_array('posting_ids')
+            if len(offsets) != len(grams) + 1 or offsets[-1] != len(ids):
+                return None
+            index = MemberSearchIndex.restore(items, grams, offsets, ids)
+
+            ranks = MemberSortRanks.restore(
+                count,
+                {column: sort_column(f'order{column}') for column in SORT_COLUMN_KEYS},
+                {column: sort_column(f'rank{column}') for column in SORT_COLUMN_KEYS},
+            )
+            return items, index, ranks
+    except (OSError, ValueError, KeyError, TypeError, struct.error) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"スナップショットを読み込めませんでした: {e}")
+        return None
+
+
+class CsvStreamLoader(QObject):
+    """CSVファイルをワーカースレッドで読み込み、一定行数ごとに通知する
+
+    検索インデックスと列ごとの並び順もワーカー側で作り、読み込み完了時に
+    まとめて渡す。
+    キャッシュに有効なスナップショットがあれば、CSVを解析せずにそこから
+    一度に復元する。CSVを解析した場合は、完了後にスナップショットを書き出す。
+    新しい読み込みを始めるか cancel() を呼ぶと、それまでの読み込みは
+    次の区切りで打ち切られ、通知も届かなくなる。
+    """
+
+    # (世代番号, 会員データのリスト, 読み込み済みバイト数, ファイルサイズ)
+    chunk_loaded = pyqtSignal(int, object, int, int)
+    # (世代番号, 検索インデックス, 並び順)
+    finished = pyqtSignal(int, object, object)
+    # (世代番号, エラーメッセージ)
+    failed = pyqtSignal(int, str)
+
+    def __init__(self, chunk_size=CSV_CHUNK_ROWS, parent=None):
+        super().__init__(parent)
+        self.chunk_size = chunk_size
+        self.generation = 0
+        self.loading = False
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="csv-loader")
+
+    def load(self, filename):
+        """読み込みを開始し、その世代番号を返す"""
+        self.generation += 1
+        self.loading = True
+        self.executor.submit(self._run, self.generation, filename)
+        return self.generation
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def cancel(self):
+        self.generation += 1
+        self.loading = False
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, generation, filename):
+        try:
+            total_bytes = os.path.getsize(filename)
+
+            snapshot = read_roster_snapshot(filename)
+            if snapshot is not None:
+                items, index, ranks = snapshot
+                if generation == self.generation:
+                    self.chunk_loaded.emit(generation, items, total_bytes, total_bytes)
+                    self.finished.emit(generation, index, ranks)
+                return
+
+            fingerprint = file_fingerprint(filename)
+            index = MemberSearchIndex()
+            items = []
+            for chunk, bytes_read in iter_member_csv_chunks(filename, self.chunk_size):
+                if generation != self.generation:
+                    return
+                for item in chunk:
+                    index.add(item)
+                items.extend(chunk)
+                self.chunk_loaded.emit(generation, chunk, bytes_read, total_bytes)
+            if generation != self.generation:
+                return
+            ranks = MemberSortRanks(items)
+            self.finished.emit(generation, index, ranks)
+        except Exception as e:
+            self.failed.emit(generation, str(e))
+            return
+
+        # 次回の起動用にスナップショットを保存する（CSVが読み込み中に変わっていれば保存しない）
+        try:
+            stat = os.stat(filename)
+            if (stat.st_size, stat.st_mtime_ns) == (fingerprint['size'], fingerprint['mtime_ns']):
+                write_roster_snapshot(filename, fingerprint, items, index, ranks)
+        except Exception as e:
+            print(f"スナップショットを保存できませんでした: {e}")
+
+
+def member_row_key(item):
+    """再読み込みの際に同じ回答とみなすためのキー（回答者名と写真のURL）"""
+    return item.parent_name, item.photo_url
+
+
+def diff_members(old_items, new_items):
+    """新旧の会員データを行のキーで突き合わせ、(追加, 削除, 変更) を返す
+
+    変更は (旧, 新) の組のリスト。同じキーの行が複数ある場合は出現順に対応させる。
+    """
+    fields = attrgetter(*MemberRecord.FIELDS)
+
+    old_by_key = {}
+    for item in old_items:
+        old_by_key.setdefault(member_row_key(item), []).append(item)
+
+    added = []
+    changed = []
+    for item in new_items:
+        candidates = old_by_key.get(member_row_key(item))
+        if not candidates:
+            added.append(item)
+            continue
+        old = candidates.pop(0)
+        if fields(old) != fields(item):
+            changed.append((old, item))
+
+    removed = [item for items in old_by_key.values() for item in items]
+    return added, removed, changed
+
+
+def group_members_by_grade(items):
+    """会員データを学年ごとにまとめる（学年の出現順を保つ）"""
+    grade_groups = {}
+    for item in items:
+        grade = item.grade or ""
+        grade_groups.setdefault(grade, []).append(item)
+    return grade_groups
+
+
+def profile_pdf_path(save_dir, grade, timestamp):
+    """学年ごとのPDFの出力パスを返す"""
+    safe_grade = re.sub(r'[\\/*?:"<>|]', '', grade)  # ファイル名に使えない文字を削除
+    return os.path.join(save_dir, f"プロフィール_{safe_grade}_{timestamp}.pdf")
+
+
+# 出力先フォルダに置く、学年ごとのPDFの指紋の記録
+PROFILE_MANIFEST_NAME = "profile_manifest.json"
+PROFILE_MANIFEST_VERSION = 1
+
+# PDFのレイアウトを変更したら上げる（以前に出力したPDFを作り直させる）
+PROFILE_LAYOUT_VERSION = 1
+
+
+def profile_export_settings(font_path, image_dpi, jpeg_quality, renderer='platypus'):
+    """学年の指紋に含める、会員データ以外でPDFの内容を決める設定"""
+    font_hash = None
+    if font_path and os.path.exists(font_path):
+        font_hash = file_fingerprint(font_path)['sha256']
+    return {
+        'layout': PROFILE_LAYOUT_VERSION,
+        'font': font_hash,
+        'image_dpi': image_dpi,
+        'jpeg_quality': jpeg_quality,
+        'renderer': renderer,
+    }
+
+
+def grade_fingerprint(grade, items, photo_hash, settings):
+    """学年のPDFの指紋（会員の項目・写真の内容・フォント・レイアウト設定のハッシュ）を返す
+
+    写真はURLではなくphoto_hash(url)が返す内容のハッシュで比べるため、
+    URLが変わっても同じ写真であれば指紋は変わらない。取得できなかった写真（Noneが返る）は
+    "missing"として指紋に含め、後で取得できたときに作り直されるようにする。
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps(dict(settings, grade=grade), sort_keys=True).encode('utf-8'))
+    for item in items:
+        fields = [item.parent_name, item.child_name, item.grade, item.child_phrase, item.parent_phrase,
+                  photo_hash(item.photo_url) or ('missing' if item.photo_url.strip() else '')]
+        digest.update(json.dumps(fields).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def load_profile_manifest(save_dir):
+    """出力先フォルダのマニフェスト（学年 -> {fingerprint, file, exported_at}）を返す"""
+    try:
+        with open(os.path.join(save_dir, PROFILE_MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != PROFILE_MANIFEST_VERSION:
+        return {}
+    return manifest.get('grades', {})
+
+
+def plan_profile_export(save_dir, grade_groups, fingerprints, timestamp, force=False):
+    """(作り直す学年のジョブのリスト, 学年 -> そのまま使える既存のPDFのパス) を返す
+
+    マニフェストに同じ指紋が記録され、そのPDFが残っている学年は作り直さない。
+    """
+    manifest = {} if force else load_profile_manifest(save_dir)
+    jobs = []
+    reused = {}
+    for grade, items in grade_groups.items():
+        entry = manifest.get(grade)
+        if entry and entry.get('fingerprint') == fingerprints[grade]:
+            existing_file = os.path.join(save_dir, entry.get('file', ''))
+            if os.path.isfile(existing_file):
+                reused[grade] = existing_file
+                continue
+        jobs.append((grade, items, profile_pdf_path(save_dir, grade, timestamp)))
+    return jobs, reused
+
+
+def record_profile_exports(save_dir, built, fingerprints):
+    """生成できた学年 [(学年, 出力ファイル)] の指紋をマニフェストに書き込む"""
+    if not built:
+        return
+    grades = load_profile_manifest(save_dir)
+    exported_at = datetime.now().isoformat(timespec='seconds')
+    for grade, output_file in built:
+        grades[grade] = {
+            'fingerprint': fingerprints[grade],
+            'file': os.path.basename(output_file),
+            'exported_at': exported_at,
+        }
+    manifest = {'version': PROFILE_MANIFEST_VERSION, 'grades': grades}
+    write_file_atomic(os.path.join(save_dir, PROFILE_MANIFEST_NAME),
+                      json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+
+# PDFに埋め込む写真の解像度（描画サイズに対するDPI）とJPEG品質
+PDF_IMAGE_DPI = 200
+PDF_IMAGE_JPEG_QUALITY = 85
+
+# 学年をまたいで再利用する、縮小・再圧縮済みの写真のメモリ上の上限サイズ
+PDF_CARD_IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# PDF出力の前に写真をまとめて取得するときの同時取得数
+PDF_PREFETCH_CONCURRENCY = 8
+
+
+def merge_image_stats(total, stats):
+    """画像の埋め込み統計を合算する"""
+    for key, value in (stats or {}).items():
+        total[key] = total.get(key, 0) + value
+    return total
+
+
+def format_image_stats(stats):
+    """画像の埋め込み統計を表示用の文字列にする"""
+    original = stats.get('original_bytes', 0)
+    embedded = stats.get('embedded_bytes', 0)
+    if not original:
+        return "埋め込んだ写真はありません"
+    saved = original - embedded
+    text = (f"写真{stats.get('images', 0)}枚: {original / (1024 * 1024):.1f}MB → "
+            f"{embedded / (1024 * 1024):.1f}MB（{saved / (1024 * 1024):.1f}MB削減, "
+            f"{saved / original * 100:.0f}%）")
+    if stats.get('shared'):
+        text += f"、同じ写真の再利用{stats['shared']}件"
+    return text
+
+
+# 行頭に置かない文字（閉じ括弧・句読点・小書きのかななど）と行末に置かない文字（開き括弧）
+LINE_START_PROHIBITED = set("、。，．,.)）]］｝〕〉》」』】〙〗〟’”!！?？:：;；・ー〜ぁぃぅぇぉっゃゅょゎァィゥェォッャュョヮヵヶ")
+LINE_END_PROHIBITED = set("(（[［｛〔〈《「『【〘〖〝‘“")
+
+
+def wrap_cjk_text(text, font_name, font_size, max_width):
+    """文字列を指定幅で折り返した行のリストを返す（日本語の禁則処理付き）
+
+    日本語は文字単位で、英数字の連続は単語単位で折り返す。行頭禁則の文字は
+    前の行に追い込み、行末禁則の文字は次の行に送る。連続する空白は
+    Paragraphと同じく1つにまとめる。
+    """
+    from reportlab.pdfbase import pdfmetrics
+
+    text = " ".join(text.split())
+    if not text:
+        return [""]
+
+    widths = {}
+
+    # 登録時に用意した文字幅の表があれば、文字ごとにstringWidthを呼ばずに済む
+    char_widths, default_width = _font_char_widths.get(font_name, (None, None))
+    scale = font_size / 1000
+
+    def width_of(chars):
+        total = 0
+        for char in chars:
+            char_width = widths.get(char)
+            if char_width is None:
+                if char_widths is not None:
+                    char_width = char_widths.get(ord(char), default_width) * scale
+                else:
+                    char_width = pdfmetrics.stringWidth(char, font_name, font_size)
+                widths[char] = char_width
+            total += char_width
+        return total
+
+    # 折り返しの単位（英数字の単語・空白・それ以外の1文字）に分ける
+    tokens = re.findall(r"[A-Za-z0-9@#$%&*+\-_=/'\".,:;!?]+| |.", text)
+
+    lines = []
+    line = []
+    line_width = 0
+    for token in tokens:
+        token_width = width_of(token)
+        if line and line_width + token_width > max_width and token != " ":
+            # 行頭禁則: 前の行の末尾に追い込む
+            if token[0] in LINE_START_PROHIBITED and len(token) == 1:
+                line.append(token)
+                line_width += token_width
+                continue
+
+            # 行末禁則: 開き括弧は次の行に送る
+            carried = []
+            while len(line) > 1 and line[-1] in LINE_END_PROHIBITED:
+                carried.insert(0, line.pop())
+
+            lines.append("".join(line).rstrip())
+            line = carried
+            line_width = width_of("".join(line))
+
+        if token == " " and not line:
+            continue
+        if token_width > max_width:
+            # 1行に収まらない長い単語は文字単位で分ける
+            for char in token:
+                char_width = width_of(char)
+                if line and line_width + char_width > max_width:
+                    lines.append("".join(line))
+                    line = []
+                    line_width = 0
+                line.append(char)
+                line_width += char_width
+            continue
+        line.append(token)
+        line_width += token_width
+
+    if line:
+        lines.append("".join(line).rstrip())
+    return lines
+
+
+# 登録したフォント名 -> (コードポイント -> 文字幅（1000分率）, 既定の幅)
+_font_char_widths = {}
+
+
+def load_font_metrics(font_path, face, cache_dir=FONT_CACHE_DIR):
+    """フォントの文字幅の表 (コードポイント -> 1000分率の幅, 既定の幅) を返す
+
+    表はフォントのパス・サイズ・更新日時とReportLabの版をキーにしてJSONでディスクに
+    保存し、キーが一致すればそれを使う。一致しなければ解析済みのface（TTFontFace）から
+    作り直して保存する。
+    """
+    from reportlab import Version as REPORTLAB_VERSION
+
+    stat = os.stat(font_path)
+    key = {
+        'version': FONT_CACHE_VERSION,
+        'reportlab': REPORTLAB_VERSION,
+        'path': os.path.abspath(font_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }
+    cache_name = hashlib.sha256(key['path'].encode('utf-8')).hexdigest()[:32] + ".json"
+    cache_path = os.path.join(cache_dir, cache_name)
+
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('key') == key:
+            widths = {int(code): float(width) for code, width in cached['widths'].items()}
+            return widths, float(cached['default_width'])
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        print(f"フォントキャッシュの読み込みエラー: {e}")
+
+    widths = dict(face.charWidths)
+    default_width = face.defaultWidth
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        write_file_atomic(cache_path, json.dumps({
+            'key': key,
+            'default_width': default_width,
+            'widths': {str(code): width for code, width in widths.items()},
+        }).encode('utf-8'))
+    except Exception as e:
+        print(f"フォントキャッシュの保存エラー: {e}")
+    return widths, default_width
+
+
+def japanese_font_registered():
+    """'JapaneseFont'がReportLabに登録済みかどうか"""
+    from reportlab.pdfbase import pdfmetrics
+    return 'JapaneseFont' in pdfmetrics.getRegisteredFontNames()
+
+
+def register_japanese_font(font_path):
+    """日本語フォントを'JapaneseFont'としてReportLabに登録する（最初のPDF出力時に呼ばれる）
+
+    PDFに埋め込まれるのは、実際に使った文字のグリフのサブセットだけ。
+    """
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    font = TTFont('JapaneseFont', font_path)
+    pdfmetrics.registerFont(font)
+    try:
+        _font_char_widths['JapaneseFont'] = load_font_metrics(font_path, font.face)
+    except Exception as e:
+        print(f"フォントの文字幅を準備できませんでした: {e}")
+
+
+class PagedStory:
+    """doc.build に渡すストーリー（フロアブルのリスト）を、1ページ分ずつ補充する
+
+    build はストーリーの先頭からフロアブルを取り出して組み、組み終えるたびに
+    afterFlowable フックを呼ぶ。refill をそのフックにすると、ストーリーが空に
+    なった時点で次のページ分が追加されるため、全ページ分を一度に持たずに済む。
+    """
+
+    def __init__(self, pages):
+        self.pages = iter(pages)
+        self.flowables = []
+        self.exhausted = False
+        self.refill()
+
+    def refill(self, flowable=None):
+        """ストーリーが空なら次のページ分を追加する"""
+        while not self.flowables and not self.exhausted:
+            page = next(self.pages, None)
+            if page is None:
+                self.exhausted = True
+            else:
+                self.flowables.extend(page)
+
+
+class ProfilePdfGenerator:
+    """学年ごとのプロフィールPDFを生成する
+
+    GUIに依存しないため、ワーカープロセスやコマンドラインからも使用できる。
+    画像データはコンストラクタで渡した関数（URL -> バイト列）から取得し、
+    描画サイズに合わせて縮小・再圧縮してから埋め込む。
+
+    renderer='platypus' はカードを入れ子のTableで組み、platypusにレイアウトさせる。
+    renderer='canvas' はカードの位置が固定であることを利用し、計算した座標に
+    canvasで直接描画する（テキストはwrap_cjk_textで事前に折り返す）。
+    """
+
+    RENDERERS = ('platypus', 'canvas')
+
+    # A4ページを2列×2行に分割するレイアウト（余白が少ないので、カードを大きくできる）
+    PAGE_MARGIN = 5 * mm
+    CARD_WIDTH = 90 * mm
+    CARD_HEIGHT = 135 * mm
+    CARD_SPACING = 2  # カード間のスペース（pt）
+    FONT_SIZE = 10
+    LEADING = 12
+
+    def __init__(self, load_image_data, image_dpi=PDF_IMAGE_DPI, jpeg_quality=PDF_IMAGE_JPEG_QUALITY,
+                 renderer='platypus'):
+        if renderer not in self.RENDERERS:
+            raise ValueError(f"不明なレンダラーです: {renderer}")
+        self.load_image_data = load_image_data
+        self.image_dpi = image_dpi
+        self.jpeg_quality = jpeg_quality
+        self.renderer = renderer
+
+        # 縮小・再圧縮した写真（元画像のSHA-256と最大サイズ -> (データ, 描画幅, 描画高さ, 元のバイト数)）。
+        # 同じファイルIDの写真や、ファイルIDが違っても内容が同じ写真は、取得と縮小を1回だけ行う
+        self.card_images = ThumbnailMemoryCache(max_bytes=PDF_CARD_IMAGE_CACHE_MAX_BYTES,
+                                                sizeof=lambda image: len(image[0]))
+        self.card_image_keys = {}  # (ファイルID（なければURL）, 最大サイズ) -> card_imagesのキー
+        # 取得・準備に失敗した写真（card_image_keysと同じキー -> エラーメッセージ）。同じ写真は取得し直さない
+        self.failed_card_images = {}
+
+        # 写真の埋め込み統計（元のバイト数と埋め込んだバイト数、同じ写真を再利用した回数）
+        self.image_stats = {'images': 0, 'original_bytes': 0, 'embedded_bytes': 0, 'shared': 0}
+        self.embedded_images = set()  # 生成中のPDFに埋め込み済みのcard_imagesのキー
+
+    def generate_profile_pdf(self, output_file, grade, items):
+        """プロフィール形式のPDFを生成し、写真の埋め込み統計を返す（日本語フォント対応、A4ページを2列×2行に分割）
+
+        同じ内容の写真は、ReportLabが画像の内容で1つのXObjectにまとめて埋め込む。
+        """
+        self.image_stats = {'images': 0, 'original_bytes': 0, 'embedded_bytes': 0, 'shared': 0}
+        self.embedded_images = set()
+
+        # 'JapaneseFont'が登録されていれば使用、なければ代替フォント
+        font_name = 'JapaneseFont' if japanese_font_registered() else 'Helvetica'
+
+        if self.renderer == 'canvas':
+            self.draw_profile_pages(output_file, grade, items, font_name)
+        else:
+            self.build_profile_document(output_file, grade, items, font_name)
+
+        return self.image_stats
+
+    def build_profile_document(self, output_file, grade, items, font_name):
+        """カードをTableで組み、platypusでPDFを生成する"""
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+
+        # PDF作成準備（余白を少なく設定）
+        doc = SimpleDocTemplate(
+            output_file,
+            pagesize=A4,
+            leftMargin=self.PAGE_MARGIN,
+            rightMargin=self.PAGE_MARGIN,
+            topMargin=self.PAGE_MARGIN,
+            bottomMargin=self.PAGE_MARGIN
+        )
+
+        # スタイル定義
+        styles = getSampleStyleSheet()
+
+        # 日本語フォントを使用したスタイル
+        japanese_style = ParagraphStyle(
+            'JapaneseStyle',
+            parent=styles['Normal'],
+            fontName=font_name,
+            fontSize=self.FONT_SIZE,
+            leading=self.LEADING,
+            wordWrap='CJK'
+        )
+
+        japanese_heading = ParagraphStyle(
+            'JapaneseHeading',
+            parent=styles['Heading1'],
+            fontName=font_name,
+            fontSize=14,
+            leading=16,
+            wordWrap='CJK'
+        )
+
+        # タイトル（余白を小さく）の後に、4枚ずつのページを順に組んで流し込む
+        title = Paragraph(f"{grade} プロフィール一覧", japanese_heading)
+        pages = self.iter_profile_pages(
+            self.iter_profile_cards(items, japanese_style, self.CARD_WIDTH, self.CARD_HEIGHT))
+
+        def page_flowables():
+            yield [title, Spacer(1, 5 * mm)]  # タイトル下のスペースも縮小
+            for page_number, cards in enumerate(pages):
+                page = [self.card_page_table(cards)]
+                if page_number:
+                    page.insert(0, PageBreak())
+                yield page
+
+        # PDFを保存（カードとその画像は1ページ分ずつしか保持しない）
+        story = PagedStory(page_flowables())
+        doc.afterFlowable = story.refill
+        doc.build(story.flowables)
+        if not story.exhausted:
+            raise RuntimeError("PDFの生成が最後のページまで進みませんでした")
+
+    def iter_profile_cards(self, items, style, card_width, card_height):
+        """会員ごとのプロフィールカードを順に作る（作れなかった会員は飛ばす）"""
+        for item in items:
+            try:
+                yield self.create_fixed_size_profile_card(item, style, card_width, card_height)
+            except Exception as e:
+                print(f"プロフィールカード作成エラー: {e}")
+                # エラーの場合はその会員をスキップ
+                continue
+
+    def iter_profile_pages(self, cards):
+        """カードを1ページ分（2列×2行の4枚）ずつまとめて返す"""
+        page = []
+        for card in cards:
+            page.append(card)
+            if len(page) == 4:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def card_page_table(self, cards):
+        """1ページ分のカードを固定サイズの2列の表に並べる"""
+        from reportlab.platypus import Table, TableStyle
+
+        rows = [list(cards[i:i + 2]) for i in range(0, len(cards), 2)]
+        # 2列になるまで空のセルで埋める
+        while len(rows[-1]) < 2:
+            rows[-1].append("")
+
+        card_spacing = self.CARD_SPACING
+        profile_table = Table(rows, colWidths=[self.CARD_WIDTH] * 2, rowHeights=[self.CARD_HEIGHT] * len(rows))
+        profile_table.setStyle(TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('TOPPADDING', (0, 0), (-1, -1), card_spacing),  # 余白を縮小
+            ('BOTTOMPADDING', (0, 0), (-1, -1), card_spacing),  # 余白を縮小
+            ('LEFTPADDING', (0, 0), (-1, -1), card_spacing),  # 余白を縮小
+            ('RIGHTPADDING', (0, 0), (-1, -1), card_spacing),  # 余白を縮小
+        ]))
+        return profile_table
+
+    def draw_profile_pages(self, output_file, grade, items, font_name):
+        """カードを計算した座標にcanvasで直接描画してPDFを生成する
+
+        配置はplatypus版（5mmの余白・フレームの内余白6pt・中央寄せの2×2の表）に
+        合わせ、1ページ分のカードの画像がそろった時点でそのページを書き出す。
+        """
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        page_width, page_height = A4
+        frame_padding = 6
+        content_left = self.PAGE_MARGIN + frame_padding
+        content_top = page_height - self.PAGE_MARGIN - frame_padding
+        content_width = page_width - 2 * (self.PAGE_MARGIN + frame_padding)
+
+        # タイトル（14pt、行送り16pt、段落後6pt）とその下の5mmの後にカードを並べる
+        title_size = 14
+        grid_left = content_left + (content_width - 2 * self.CARD_WIDTH) / 2
+        grid_top = content_top - 16 - 6 - 5 * mm
+
+        pdf = canvas.Canvas(output_file, pagesize=A4)
+        pdf.setTitle(f"{grade} プロフィール一覧")
+        pdf.setFont(font_name, title_size)
+        pdf.drawString(content_left, content_top - title_size, f"{grade} プロフィール一覧")
+
+        cards = self.iter_profile_layouts(items, font_name)
+        for page_number, page in enumerate(self.iter_profile_pages(cards)):
+            if page_number:
+                # 2ページ目以降は改ページ後のplatypus版と同じくフレームの上端から並べる
+                pdf.showPage()
+                grid_top = content_top
+
+            for slot, card in enumerate(page):
+                column, row = slot % 2, slot // 2
+                self.draw_profile_card(pdf, card, font_name,
+                                       grid_left + column * self.CARD_WIDTH,
+                                       grid_top - row * self.CARD_HEIGHT - self.CARD_SPACING)
+
+        pdf.save()
+
+    def iter_profile_layouts(self, items, font_name):
+        """会員ごとのカードの描画内容を順に作る（作れなかった会員は飛ばす）"""
+        for item in items:
+            try:
+                yield self.layout_profile_card(item, font_name)
+            except Exception as e:
+                print(f"プロフィールカード作成エラー: {e}")
+                # エラーの場合はその会員をスキップ
+                continue
+
+    def card_texts(self, item):
+        """カードに載せるテキストの行（空文字列は空行）"""
+        texts = []
+        texts.append(f"お名前: {item.parent_name}")
+        texts.append(f"お子様: {item.child_name}")
+        if item.child_phrase:
+            texts.append("")
+            texts.append(f"ご挨拶: ")
+            texts.append(f"{item.child_phrase}")
+        if item.parent_phrase:
+            texts.append("")
+            texts.append(f"お住まいの地域: {item.parent_phrase}")
+        return texts
+
+    def card_geometry(self):
+        """カード内の (内部幅, 画像エリアの高さ, テキストエリアの高さ)"""
+        inner_width = self.CARD_WIDTH * 0.95
+        image_area_height = self.CARD_HEIGHT * 0.5
+        text_area_height = self.CARD_HEIGHT - image_area_height - 5 * mm
+        return inner_width, image_area_height, text_area_height
+
+    def layout_profile_card(self, item, font_name):
+        """描画前のカード（折り返し済みのテキスト行と写真）を用意する"""
+        inner_width, image_area_height, text_area_height = self.card_geometry()
+
+        lines = []
+        for text in self.card_texts(item):
+            lines.extend(wrap_cjk_text(text, font_name, self.FONT_SIZE, inner_width))
+
+        # テキストエリアに収まらない行は省略する
+        max_lines = max(1, int((text_area_height - self.FONT_SIZE) // self.LEADING) + 1)
+        if len(lines) > max_lines:
+            lines = lines[:max_lines]
+            lines[-1] = lines[-1][:-1] + "…" if lines[-1] else "…"
+
+        image = None
+        if item.photo_url and item.photo_url.strip():
+            try:
+                image = self.load_card_image(item, inner_width * 0.8, image_area_height * 0.9)
+            except Exception as e:
+                print(f"プロフィールカード画像処理エラー: {e}")
+
+        return lines, image
+
+    def draw_profile_card(self, pdf, card, font_name, x, top):
+        """用意したカードを左上 (x, top) に描画する"""
+        from reportlab.lib import colors
+        from reportlab.lib.utils import ImageReader
+
+        lines, image = card
+        inner_width, image_area_height, _ = self.card_geometry()
+
+        # 外枠線
+        pdf.setStrokeColor(colors.grey)
+        pdf.setLineWidth(0.5)
+        pdf.rect(x, top - self.CARD_HEIGHT, self.CARD_WIDTH, self.CARD_HEIGHT, stroke=1, fill=0)
+
+        # 枠内の余白3ptの内側に、内部コンテンツを中央寄せで置く
+        inner_left = x + 3 + (self.CARD_WIDTH - 6 - inner_width) / 2
+        inner_top = top - 3
+
+        # 写真は画像エリアの中央に置く
+        if image is not None:
+            image_data, draw_width, draw_height = image
+            image_x = inner_left + (inner_width - draw_width) / 2
+            image_y = inner_top - image_area_height / 2 - draw_height / 2
+            try:
+                pdf.drawImage(ImageReader(BytesIO(image_data)), image_x, image_y, draw_width, draw_height)
+            except Exception as rl_err:
+                print(f"ReportLab画像読み込みエラー: {rl_err}")
+                try:
+                    pdf.drawImage(ImageReader(self.convert_to_jpeg(image_data)),
+                                  image_x, image_y, draw_width, draw_height)
+                except Exception as retry_err:
+                    print(f"画像変換再試行エラー: {retry_err}")
+
+        # テキストは画像エリアの下から左揃えで描く
+        text = pdf.beginText(inner_left, inner_top - image_area_height - self.FONT_SIZE)
+        text.setFont(font_name, self.FONT_SIZE, self.LEADING)
+        for line in lines:
+            text.textLine(line)
+        pdf.drawText(text)
+
+    def prepare_image(self, pil_image, draw_width, draw_height):
+        """描画サイズ（pt）と解像度に合わせて写真を縮小・再圧縮したJPEGを返す（EXIFは除去）"""
+        from PIL import Image
+
+        target_width = max(1, round(draw_width / 72 * self.image_dpi))
+        target_height = max(1, round(draw_height / 72 * self.image_dpi))
+
+        image = pil_image
+        if image.width > target_width or image.height > target_height:
+            image = image.resize((target_width, target_height), Image.LANCZOS)
+
+        # JPEGにするため透明部分は白で塗りつぶす
+        if image.mode != 'RGB':
+            rgba_image = image.convert('RGBA')
+            image = Image.new('RGB', rgba_image.size, (255, 255, 255))
+            image.paste(rgba_image, mask=rgba_image.split()[3])
+
+        # exifを渡さずに保存することでEXIF（位置情報など）を除去する
+        output = BytesIO()
+        image.save(output, 'JPEG', quality=self.jpeg_quality, optimize=True)
+        return output.getvalue()
+
+    def load_card_image(self, item, max_width, max_height):
+        """カードに載せる写真を (埋め込むデータ, 描画幅, 描画高さ) で返す（取得できない場合は例外）
+
+        縦横比を保って最大サイズに収め、描画サイズに合わせて縮小・再圧縮する。
+        同じファイルIDや同じ内容の写真は、前に用意したものを使う。
+        同じファイルIDの写真で前に失敗していれば、取得し直さずに同じエラーで例外を送出する。
+        """
+        source_key = (item.photo_file_id or item.photo_url.strip(), max_width, max_height)
+        failure = self.failed_card_images.get(source_key)
+        if failure is not None:
+            raise ValueError(failure)
+
+        cache_key = self.card_image_keys.get(source_key)
+        image = self.card_images.get(cache_key) if cache_key else None
+
+        if image is None:
+            try:
+                # ディスクキャッシュまたはネットワークから画像データを取得
+                image_data = self.load_image_data(item.photo_url)
+
+                if not image_data:
+                    raise ValueError(f"画像データを取得できませんでした: {item.photo_url}")
+
+                # ファイルIDが違っても内容が同じ写真は同じものとして扱う
+                cache_key = (hashlib.sha256(image_data).hexdigest(), max_width, max_height)
+                image = self.card_images.get(cache_key)
+                if image is None:
+                    image = self.prepare_card_image(image_data, max_width, max_height)
+                    self.card_images.put(cache_key, image)
+            except Exception as e:
+                self.failed_card_images[source_key] = str(e) or type(e).__name__
+                raise
+            self.card_image_keys[source_key] = cache_key
+
+        prepared_data, draw_width, draw_height, original_size = image
+        if cache_key in self.embedded_images:
+            self.image_stats['shared'] += 1
+        else:
+            self.embedded_images.add(cache_key)
+            self.image_stats['images'] += 1
+            self.image_stats['original_bytes'] += original_size
+            self.image_stats['embedded_bytes'] += len(prepared_data)
+        return prepared_data, draw_width, draw_height
+
+    def prepare_card_image(self, image_data, max_width, max_height):
+        """写真を最大サイズに収めて縮小・再圧縮し、(データ, 描画幅, 描画高さ, 元のバイト数) を返す"""
+        from PIL import Image, ImageOps
+
+        # 画像データの検証
+        pil_image = None
+        try:
+            pil_image = Image.open(BytesIO(image_data))
+
+            # EXIFの向き情報を適用してから画像のサイズを取得
+            pil_image = ImageOps.exif_transpose(pil_image)
+            orig_width, orig_height = pil_image.size
+
+            # 縦横比を計算
+            aspect_ratio = orig_width / orig_height
+        except Exception as img_err:
+            print(f"画像検証エラー: {img_err}")
+            aspect_ratio = 1.0  # デフォルト
+
+        # 縦横比を維持する高さを計算
+        draw_width = max_width
+        draw_height = draw_width / aspect_ratio if aspect_ratio > 0 else draw_width
+
+        # 最大高さも制限
+        if draw_height > max_height:
+            draw_height = max_height
+            draw_width = draw_height * aspect_ratio
+
+        # 描画サイズに合わせて縮小・再圧縮
+        prepared_data = image_data
+        if pil_image is not None:
+            try:
+                prepared_data = self.prepare_image(pil_image, draw_width, draw_height)
+            except Exception as prep_err:
+                print(f"画像の縮小・再圧縮エラー: {prep_err}")
+            finally:
+                pil_image.close()
+
+        return prepared_data, draw_width, draw_height, len(image_data)
+
+    @staticmethod
+    def convert_to_jpeg(image_data):
+        """ReportLabで読み込めない画像を、PILでJPEGに変換したバッファにする（透明度は除去）"""
+        from PIL import Image
+
+        with Image.open(BytesIO(image_data)) as pil_image:
+            converted = BytesIO()
+            pil_image.convert('RGB').save(converted, "JPEG", quality=90)
+        converted.seek(0)
+        return converted
+
+    def create_fixed_size_profile_card(self, item, style, card_width, card_height):
+        """一人分の固定サイズプロフィールカードを作成（テキスト開始位置を統一）"""
+        from reportlab.lib import colors
+        from reportlab.lib.styles import ParagraphStyle
+        from reportlab.platypus import Table, TableStyle, Paragraph, Image as ReportLabImage
+
+        # 固定サイズの枠を作成するため、外側のコンテナを定義
+        # カードの内部コンテンツ用の幅（枠線内側の幅）
+        inner_width = card_width * 0.95  # 内部幅の比率を拡大（余白を少なく）
+
+        # 画像エリアの固定高さ（テキスト開始位置を統一するため）
+        fixed_image_area_height = card_height * 0.5  # カード高さの半分を画像エリアに
+
+        # プロフィール情報を整理
+        texts = self.card_texts(item)
+
+        # スタイルに最大幅を設定して、テキストが枠からはみ出さないようにする
+        text_style = ParagraphStyle(
+            'FixedWidthStyle',
+            parent=style,
+            wordWrap='CJK',
+            allowWidows=0,
+            allowOrphans=0
+        )
+
+        # 全てのテキストを1つのパラグラフにまとめる
+        content = Paragraph("<br/>".join(texts), text_style)
+
+        # 画像の処理（一時ファイルを使わず、すべてメモリ上のバッファで扱う）
+        img = None
+        img_container = None
+
+        if item.photo_url and item.photo_url.strip():
+            try:
+                # 画像の最大サイズ（内部幅の80%、固定画像エリアの90%）- 余白が少ないので大きく表示
+                image_data, max_img_width, img_height = self.load_card_image(
+                    item, inner_width * 0.8, fixed_image_area_height * 0.9)
+
+                # レポートラボの画像オブジェクト作成を試みる
+                try:
+                    img = ReportLabImage(BytesIO(image_data), width=max_img_width, height=img_height)
+                except Exception as rl_err:
+                    print(f"ReportLab画像読み込みエラー: {rl_err}")
+
+                    # 代替手段: PILでJPEGに変換して再試行
+                    try:
+                        img = ReportLabImage(self.convert_to_jpeg(image_data), width=max_img_width, height=img_height)
+                    except Exception as retry_err:
+                        print(f"画像変換再試行エラー: {retry_err}")
+                        img = None
+
+                if img is not None:
+                    # 画像を固定高さのコンテナに配置して、位置を中央に
+                    # これにより、画像サイズに関わらずテキスト開始位置を統一
+                    img_container = Table(
+                        [[img]],
+                        colWidths=[inner_width],
+                        rowHeights=[fixed_image_area_height]
+                    )
+
+                    img_container.setStyle(TableStyle([
+                        ('ALIGN', (0, 0), (0, 0), 'CENTER'),  # 水平中央揃え
+                        ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),  # 垂直中央揃え
+                        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+                        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+                        ('TOPPADDING', (0, 0), (-1, -1), 0),
+                        ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+                    ]))
+
+            except Exception as e:
+                print(f"プロフィールカード画像処理エラー: {e}")
+                img = None
+                img_container = None
+
+        # 画像がない場合、空の固定高さコンテナを作成
+        if img_container is None:
+            img_container = Table(
+                [[""]],  # 空のコンテンツ
+                colWidths=[inner_width],
+                rowHeights=[fixed_image_area_height]
+            )
+
+            img_container.setStyle(TableStyle([
+                ('ALIGN', (0, 0), (0, 0), 'CENTER'),
+                ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
+                ('LEFTPADDING', (0, 0), (-1, -1), 0),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+                ('TOPPADDING', (0, 0), (-1, -1), 0),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+            ]))
+
+        # テキストコンテナ（テキスト部分の高さも固定）
+        text_container = Table(
+            [[content]],
+            colWidths=[inner_width],
+            rowHeights=[card_height - fixed_image_area_height - 5 * mm]  # マージンを小さくして高さを拡大
+        )
+
+        text_container.setStyle(TableStyle([
+            ('ALIGN', (0, 0), (0, 0), 'LEFT'),  # テキストは左揃え
+            ('VALIGN', (0, 0), (0, 0), 'TOP'),  # 上揃え
+            ('LEFTPADDING', (0, 0), (-1, -1), 0),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+            ('TOPPADDING', (0, 0), (-1, -1), 0),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+        ]))
+
+        # 画像エリアとテキストエリアを組み合わせた内部コンテンツ
+        content_table = Table(
+            [
+                [img_container],
+                [text_container]
+            ],
+            colWidths=[inner_width]
+        )
+
+        content_table.setStyle(TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 0),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+            ('TOPPADDING', (0, 0), (-1, -1), 0),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+        ]))
+
+        # 固定サイズのフレーム内に内部コンテンツを配置
+        outer_table = Table(
+            [[content_table]],
+            colWidths=[card_width],
+            rowHeights=[card_height]
+        )
+
+        # 外側のテーブルにスタイルを適用
+        outer_table.setStyle(TableStyle([
+            ('BOX', (0, 0), (-1, -1), 0.5, colors.grey),  # 外枠線
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 3),  # 枠内の余白を小さく
+            ('RIGHTPADDING', (0, 0), (-1, -1), 3),  # 枠内の余白を小さく
+            ('TOPPADDING', (0, 0), (-1, -1), 3),  # 枠内の余白を小さく
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),  # 枠内の余白を小さく
+        ]))
+
+        return outer_table
+
+
+def unique_photo_urls(items):
+    """会員の写真のURLを、同じファイルID（なければ同じURL）の重複を除いて返す"""
+    seen = set()
+    urls = []
+    for item in items:
+        if not item.photo_url or not item.photo_url.strip():
+            continue
+        key = item.photo_file_id or item.photo_url.strip()
+        if key not in seen:
+            seen.add(key)
+            urls.append(item.photo_url)
+    return urls
+
+
+def prefetch_images(load_image_data, urls, max_workers=PDF_PREFETCH_CONCURRENCY, on_progress=None, is_canceled=None):
+    """写真をスレッドで並列に取得し、取得できなかったURLのリストを返す
+
+    取得した写真はディスクキャッシュに入るため、この後の指紋の計算とレイアウトは
+    ネットワークを待たずに進む。on_progress(完了数, 全体数) は0.1秒ごとに呼び出し、
+    is_canceled() が真を返したら未開始の取得を取り消して戻る。
+    """
+    failed = []
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="pdf-prefetch")
+    futures = {executor.submit(load_image_data, url): url for url in urls}
+    pending = set(futures)
+
+    try:
+        while pending:
+            if is_canceled is not None and is_canceled():
+                break
+
+            done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    image_data = future.result()
+                except Exception as e:
+                    print(f"写真の取得エラー: {e}")
+                    image_data = None
+                if image_data is None:
+                    failed.append(futures[future])
+
+            if on_progress is not None:
+                on_progress(len(urls) - len(pending), len(urls))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return failed
+
+
+# ワーカープロセスごとに1つ作る画像ローダーと、設定ごとのPDF生成器（縮小済みの写真を学年間で共有する）
+_worker_image_loader = None
+_worker_pdf_generators = {}
+
+
+def generate_grade_pdf_job(output_file, grade, items, font_path=None,
+                           image_dpi=PDF_IMAGE_DPI, jpeg_quality=PDF_IMAGE_JPEG_QUALITY, renderer='platypus'):
+    """プロセスプールで1学年分のPDFを生成し、写真の埋め込み統計と所要時間を返す（ワーカープロセスで実行）"""
+    global _worker_image_loader
+
+    started = time.perf_counter()
+
+    # フォント登録はプロセスごとに必要
+    if font_path and not japanese_font_registered():
+        register_japanese_font(font_path)
+
+    # 写真は呼び出し元が先読みでディスクキャッシュに入れているため、ワーカーではネットワークを使わない
+    if _worker_image_loader is None:
+        _worker_image_loader = ImageLoader(ImageDiskCache(), fetcher=None)
+
+    settings = (image_dpi, jpeg_quality, renderer)
+    generator = _worker_pdf_generators.get(settings)
+    if generator is None:
+        generator = _worker_pdf_generators[settings] = ProfilePdfGenerator(
+            _worker_image_loader.get_cached, image_dpi=image_dpi, jpeg_quality=jpeg_quality, renderer=renderer)
+    stats = generator.generate_profile_pdf(output_file, grade, items)
+    return dict(stats, elapsed=time.perf_counter() - started)
+
+
+def filter_and_sort_members(request, is_stale):
+    """絞り込みと並べ替えを行う（ワーカースレッドで実行）。古くなった場合はNoneを返す"""
+    member_ids = request['index'].search(request['search_term'], request['grade'])
+    if is_stale():
+        return None
+
+    member_ids = request['ranks'].sort(
+        member_ids, request['sort_column'], request['sort_order'] == Qt.DescendingOrder
+    )
+    if is_stale():
+        return None
+
+    return list(map(request['data'].__getitem__, member_ids))
+
+
+class FilterScheduler(QObject):
+    """絞り込みの要求を間引き、ワーカースレッドで実行して最新の結果だけを通知する
+
+    schedule()が呼ばれるたびにタイマーを延長し、入力が止まってから
+    make_request()で条件を取得して計算する。計算中に新しい要求があれば
+    古い計算は途中で打ち切られ、結果も破棄される。
+    """
+
+    # (世代番号, 要求, 結果)
+    result_ready = pyqtSignal(int, object, object)
+
+    def __init__(self, make_request, compute, delay_ms=150, parent=None):
+        super().__init__(parent)
+        self.make_request = make_request
+        self.compute = compute
+        self.generation = 0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay_ms)
+        self.timer.timeout.connect(self.start)
+
+        # 要求は1本のスレッドで順番に処理する（古い要求はすぐに捨てられる）
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="filter")
+
+    def schedule(self):
+        """入力が落ち着いてから絞り込みを開始する"""
+        self.timer.start()
+
+    def start(self):
+        """待たずに絞り込みを開始する"""
+        self.timer.stop()
+        self.generation += 1
+        self.executor.submit(self._run, self.generation, self.make_request())
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def cancel(self):
+        """待機中・計算中の要求を取り消す"""
+        self.timer.stop()
+        self.generation += 1
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, generation, request):
+        def is_stale():
+            return generation != self.generation
+
+        if is_stale():
+            return
+        try:
+            result = self.compute(request, is_stale)
+        except Exception as e:
+            print(f"絞り込みエラー: {e}")
+            return
+        if result is not None and not is_stale():
+            self.result_ready.emit(generation, request, result)
+
+
+# 会員一覧の行の高さ（px）
+TABLE_ROW_HEIGHT = 70
+
+
+class MemberTableModel(QAbstractTableModel):
+    """絞り込み・並べ替え済みの会員データを表示するテーブルモデル
+
+    写真列はthumbnail_provider（URL -> (QPixmapまたはNone, 表示文字列)）から
+    取得するため、表示される行のサムネイルだけが参照される。
+    """
+
+    HEADERS = ["詳細", "写真", "ご本人名", "お子様名", "高等部二年生保護者の皆様へご挨拶", "お住まいの地域"]
+    TEXT_COLUMNS = {2: 'parent_name', 3: 'child_name', 4: 'grade'}
+
+    def __init__(self, thumbnail_provider, parent=None):
+        super().__init__(parent)
+        self.thumbnail_provider = thumbnail_provider
+        self.members = []
+
+        # 写真のURL -> そのURLを表示している行番号のリスト
+        self.url_rows = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.members)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        item = self.members[index.row()]
+        column = index.column()
+
+        if column == 1:
+            url = item.photo_url
+            if not url or not url.strip():
+                return "画像なし" if role == Qt.DisplayRole else None
+            if role in (Qt.DisplayRole, Qt.DecorationRole):
+                pixmap, text = self.thumbnail_provider(url)
+                return pixmap if role == Qt.DecorationRole else (text if pixmap is None else None)
+            return None
+
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return "詳細"
+            key = self.TEXT_COLUMNS.get(column)
+            return getattr(item, key) if key else None
+
+        if role == Qt.TextAlignmentRole and column == 4:
+            return Qt.AlignCenter
+
+        return None
+
+    def set_members(self, members):
+        """表示する会員を入れ替える"""
+        self.beginResetModel()
+        self.members = members
+        self._index_urls()
+        self.endResetModel()
+
+    def reorder_members(self, members):
+        """同じ会員の並び順だけを変更する（行の再作成は行わない）"""
+        self.layoutAboutToBeChanged.emit()
+        self.members = members
+        self._index_urls()
+        self.layoutChanged.emit()
+
+    def append_members(self, members):
+        """表示中の会員の末尾に行を追加する（既存の行は作り直さない）"""
+        if not members:
+            return
+        first = len(self.members)
+        self.beginInsertRows(QModelIndex(), first, first + len(members) - 1)
+        self.members.extend(members)
+        self._index_urls(first)
+        self.endInsertRows()
+
+    def sync_members(self, members, key=member_row_key):
+        """表示する会員を、行の削除・挿入・変更の通知だけで入れ替える
+
+        新旧の行はkey（同じキーが複数ある場合は出現順）で対応させる。残る行の
+        並び順が変わらなければ新しい行をその位置に挿入し、変わった場合は末尾に
+        追加してから並び順の変更を通知する。内容が変わった行は再描画させる。
+        """
+        old_keys = self._row_keys(self.members, key)
+        new_keys = self._row_keys(members, key)
+        old_key_set = set(old_keys)
+        new_key_set = set(new_keys)
+        self.members = list(self.members)
+
+        # 表示から外れる行を、連続する範囲ごとに後ろから削除する
+        removed_rows = [row for row, row_key in enumerate(old_keys) if row_key not in new_key_set]
+        for first, last in reversed(self._row_ranges(removed_rows)):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.members[first:last + 1]
+            del old_keys[first:last + 1]
+            self.endRemoveRows()
+
+        old_items = dict(zip(old_keys, self.members))
+        reordered = [row_key for row_key in new_keys if row_key in old_key_set] != old_keys
+
+        if not reordered:
+            # 新しい行を最終的な位置に、前から順に挿入する
+            added_rows = [row for row, row_key in enumerate(new_keys) if row_key not in old_key_set]
+            for first, last in self._row_ranges(added_rows):
+                self.beginInsertRows(QModelIndex(), first, last)
+                self.members[first:first] = members[first:last + 1]
+                self.endInsertRows()
+        else:
+            added = [item for item, row_key in zip(members, new_keys) if row_key not in old_key_set]
+            if added:
+                first = len(self.members)
+                self.beginInsertRows(QModelIndex(), first, first + len(added) - 1)
+                self.members.extend(added)
+                self.endInsertRows()
+            self.layoutAboutToBeChanged.emit()
+
+        self.members = members
+        self._index_urls()
+        if reordered:
+            self.layoutChanged.emit()
+
+        fields = attrgetter(*MemberRecord.FIELDS)
+        last_column = len(self.HEADERS) - 1
+        for row, (item, row_key) in enumerate(zip(members, new_keys)):
+            old = old_items.get(row_key)
+            if old is not None and fields(old) != fields(item):
+                self.dataChanged.emit(self.index(row, 0), self.index(row, last_column))
+
+    @staticmethod
+    def _row_keys(members, key):
+        """行ごとの (キー, 同じキーの中での出現順) のリストを返す"""
+        counts = {}
+        row_keys = []
+        for item in members:
+            row_key = key(item)
+            occurrence = counts.get(row_key, 0)
+            counts[row_key] = occurrence + 1
+            row_keys.append((row_key, occurrence))
+        return row_keys
+
+    @staticmethod
+    def _row_ranges(rows):
+        """昇順の行番号を、連続する (最初, 最後) の範囲のリストにまとめる"""
+        ranges = []
+        for row in rows:
+            if ranges and ranges[-1][1] == row - 1:
+                ranges[-1][1] = row
+            else:
+                ranges.append([row, row])
+        return ranges
+
+    def thumbnail_updated(self, url):
+        """サムネイルの取得が終わった写真の行を再描画させる"""
+        for row in self.url_rows.get(url, ()):
+            index = self.index(row, 1)
+            self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.DecorationRole])
+
+    def _index_urls(self, first=0):
+        if first == 0:
+            self.url_rows = {}
+        for row in range(first, len(self.members)):
+            item = self.members[row]
+            if item.photo_url:
+                self.url_rows.setdefault(item.photo_url, []).append(row)
+
+
+class MemberTableDelegate(QStyledItemDelegate):
+    """詳細ボタンとサムネイルを描画するデリゲート（セルごとのウィジェットを作らない）"""
+
+    details_clicked = pyqtSignal(int)
+
+    def paint(self, painter, option, index):
+        column = index.column()
+
+        if column == 0:
+            button = QStyleOptionButton()
+            button.rect = option.rect.adjusted(4, 4, -4, -4)
+            button.text = index.data(Qt.DisplayRole)
+            button.state = QStyle.State_Enabled | QStyle.State_Raised
+            style = option.widget.style() if option.widget else QApplication.style()
+            style.drawControl(QStyle.CE_PushButton, button, painter, option.widget)
+            return
+
+        if column == 1:
+            if option.state & QStyle.State_Selected:
+                painter.fillRect(option.rect, option.palette.highlight())
+            pixmap = index.data(Qt.DecorationRole)
+            if pixmap is not None and not pixmap.isNull():
+                x = option.rect.x() + (option.rect.width() - pixmap.width()) // 2
+                y = option.rect.y() + (option.rect.height() - pixmap.height()) // 2
+                painter.drawPixmap(x, y, pixmap)
+            else:
+                painter.drawText(option.rect, Qt.AlignCenter, index.data(Qt.DisplayRole) or "")
+            return
+
+        super().paint(painter, option, index)
+
+    def editorEvent(self, event, model, option, index):
+        if (index.column() == 0 and event.type() == QEvent.MouseButtonRelease
+                and event.button() == Qt.LeftButton and option.rect.contains(event.pos())):
+            self.details_clicked.emit(index.row())
+            return True
+        return super().editorEvent(event, model, option, index)
+
+
+class StartupTimeline:
+    """起動の各段階（モジュールの読み込み・フォント・CSV・最初の描画）の経過時間を記録する
+
+    enabled のときは、最初の描画とCSVの読み込みが済んだ時点で一覧を表示する。
+    """
+
+    CSV_STAGES = ('CSV読み込み完了', 'CSV読み込みエラー', 'CSVなし')
+
+    def __init__(self, started):
+        self.started = started
+        self.stages = {}  # 段階名 -> 起動からの経過秒（記録した順）
+        self.enabled = False
+        self.reported = False
+
+    def mark(self, stage):
+        """段階の経過時間を記録する（同じ段階は最初の1回だけ）"""
+        if stage in self.stages:
+            return
+        self.stages[stage] = time.perf_counter() - self.started
+
+        if (self.enabled and not self.reported and '最初の描画' in self.stages
+                and any(csv_stage in self.stages for csv_stage in self.CSV_STAGES)):
+            self.reported = True
+            print(self.format())
+
+    def format(self):
+        """記録した段階を経過時間と前の段階からの差分で並べた文字列"""
+        lines = ["起動タイムライン:"]
+        previous = 0.0
+        for stage, elapsed in self.stages.items():
+            lines.append(f"  {elapsed * 1000:8.1f}ms (+{(elapsed - previous) * 1000:7.1f}ms)  {stage}")
+            previous = elapsed
+        return "\n".join(lines)
+
+
+STARTUP_TIMELINE = StartupTimeline(STARTUP_STARTED)
 
 
 class MemberManagementApp(QMainWindow):
@@ -39,6 +2741,8 @@ class MemberManagementApp(QMainWindow):
         # データ保存用
         self.data = []
         self.filtered_data = []
+        self.search_index = MemberSearchIndex()
+        self.sort_ranks = MemberSortRanks()
 
         # 並べ替え状態を保存
         self.sort_column = 2  # デフォルトは子供の名前
@@ -47,26 +2751,82 @@ class MemberManagementApp(QMainWindow):
         # 詳細表示管理用の辞書
         self.expanded_rows = {}
 
+        # CSVはワーカースレッドで読み込み、読み込んだ分から表示する
+        self.csv_loader = CsvStreamLoader(parent=self)
+        self.csv_loader.chunk_loaded.connect(self.on_csv_chunk_loaded)
+        self.csv_loader.finished.connect(self.on_csv_load_finished)
+        self.csv_loader.failed.connect(self.on_csv_load_failed)
+        self.csv_load_state = None
+
+        # 検索語の入力を間引き、絞り込みをワーカースレッドで行う
+        self.filter_scheduler = FilterScheduler(self.current_filter_request, filter_and_sort_members, parent=self)
+        self.filter_scheduler.result_ready.connect(self.on_filter_result)
+
         # 現在のCSVファイルパス
         self.current_csv_path = "ANS.csv"
 
-        # 画像キャッシュ
-        self.image_cache = {}
+        # 再読み込みで会員に変更があり、まだPDFを出力していない学年
+        self.changed_grades = set()
+
+        # 再読み込み後の絞り込み結果を、表の作り直しではなく行単位で反映するか
+        self.sync_rows_on_filter = False
+
+        # 画像キャッシュ（推定バイト数で上限を管理するLRU）
+        self.image_cache = ThumbnailMemoryCache()
+
+        # CSVを読み込み直したときに、新しい名簿で使わない画像をキャッシュから外すか
+        self.prune_image_cache_on_reload = True
+
+        # 再起動後やPDF出力でも再利用するディスク画像キャッシュ
+        self.image_disk_cache = ImageDiskCache()
+
+        # 成功したURLパターンを学習する画像取得
+        self.image_fetcher = ImageFetcher()
+        self.image_loader = ImageLoader(self.image_disk_cache, self.image_fetcher)
+
+        # 取得に失敗した画像のURL（再取得を繰り返さないため）
+        self.image_errors = set()
+
+        # 写真のバックグラウンド先読み
+        self.image_prefetcher = ImagePrefetcher(self.load_thumbnail_image, max_workers=4, parent=self)
+        self.image_prefetcher.thumbnail_ready.connect(self.on_thumbnail_ready)
+
+        # PDF出力の設定（学年ごとのPDFを別プロセスで並列に生成するか）
+        self.parallel_pdf_export = False
+
+        # PDF出力の前に写真をまとめて取得するときの同時取得数
+        self.pdf_prefetch_concurrency = PDF_PREFETCH_CONCURRENCY
+
+        # PDFに埋め込む写真の解像度とJPEG品質
+        self.pdf_image_dpi = PDF_IMAGE_DPI
+        self.pdf_jpeg_quality = PDF_IMAGE_JPEG_QUALITY
+
+        # PDFの描画方式（'platypus'または'canvas'）
+        self.pdf_renderer = 'platypus'
+
+        STARTUP_TIMELINE.mark('キャッシュと画像取得の準備')
 
         # PDF用の日本語フォント設定
+        self.pdf_font_path = None
         self.initialize_pdf_fonts()
+        STARTUP_TIMELINE.mark('フォントの確認')
 
         # UI設定
         self.init_ui()
+        STARTUP_TIMELINE.mark('画面の構築')
 
         # データ読み込み
         self.load_data(self.current_csv_path)
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        STARTUP_TIMELINE.mark('最初の描画')
+
     def initialize_pdf_fonts(self):
-        """PDF用の日本語フォントを初期化"""
+        """PDF用の日本語フォントを探す（解析と登録は最初のPDF出力時に行う）"""
         try:
             # フォント設定ファイルパス
-            font_config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "font_config.txt")
+            font_config_path = FONT_CONFIG_PATH
 
             # 保存されたフォント設定を読み込む
             font_path = None
@@ -109,13 +2869,10 @@ class MemberManagementApp(QMainWindow):
                 self.statusBar().showMessage("日本語フォントが見つかりません。PDF出力にはフォント選択が必要です。")
                 return
 
-            # 見つかったフォントを登録
-            print(f"フォントを登録します: {font_path}")
-
-            # otf/ttfファイルのみ登録
+            # otf/ttfファイルのみ使用（解析と登録は最初のPDF出力時に行う）
             if font_path.endswith('.ttf') or font_path.endswith('.otf'):
-                pdfmetrics.registerFont(TTFont('JapaneseFont', font_path))
-                print("フォント登録成功")
+                self.pdf_font_path = font_path
+                print(f"PDF用フォント: {font_path}")
 
                 # 設定ファイルに保存
                 try:
@@ -134,10 +2891,21 @@ class MemberManagementApp(QMainWindow):
 
     def check_font_before_pdf_export(self):
         """PDF出力前にフォント設定をチェックし、必要に応じてフォント選択ダイアログを表示"""
-        # 登録済みのフォント名を確認
-        registered_fonts = pdfmetrics.getRegisteredFontNames()
+        # 起動時に見つけたフォントは、最初のPDF出力時にここで登録する
+        if self.pdf_font_path and not japanese_font_registered():
+            self.statusBar().showMessage("フォントを読み込み中...")
+            QApplication.processEvents()
+            try:
+                started = time.perf_counter()
+                register_japanese_font(self.pdf_font_path)
+                print(f"フォント登録成功: {self.pdf_font_path} ({time.perf_counter() - started:.2f}秒)")
+                self.statusBar().clearMessage()
+            except Exception as e:
+                print(f"フォント登録エラー: {e}")
+                self.statusBar().showMessage(f"フォント登録エラー: {e}")
 
-        if 'JapaneseFont' not in registered_fonts:
+        # 登録済みのフォント名を確認
+        if not japanese_font_registered():
             # フォントが登録されていない場合
             reply = QMessageBox.question(
                 self,
@@ -152,7 +2920,7 @@ class MemberManagementApp(QMainWindow):
                 self.select_font_file()
 
                 # フォントが選択されたか再確認
-                if 'JapaneseFont' not in pdfmetrics.getRegisteredFontNames():
+                if not japanese_font_registered():
                     QMessageBox.warning(
                         self,
                         "フォント未設定",
@@ -170,8 +2938,19 @@ class MemberManagementApp(QMainWindow):
 
         return True
 
-    def export_to_pdf(self):
-        """学年ごとにPDFを出力する（フォントチェック付き）"""
+    def export_changed_grades_to_pdf(self):
+        """再読み込みで会員に変更があった学年だけPDFを出力する"""
+        if not self.changed_grades:
+            QMessageBox.information(self, "PDF出力", "前回の出力以降に変更のあった学年はありません。")
+            return
+        self.export_to_pdf(grades=set(self.changed_grades))
+
+    def export_to_pdf(self, grades=None):
+        """学年ごとにPDFを出力する（フォントチェック付き）。gradesを指定するとその学年だけ出力する"""
+        if self.csv_loader.loading:
+            QMessageBox.information(self, "読み込み中", "CSVファイルの読み込みが終わってから出力してください。")
+            return
+
         # フォント設定をチェック
         if not self.check_font_before_pdf_export():
             # ユーザーがキャンセルしたか、フォント設定に失敗した場合
@@ -191,70 +2970,223 @@ class MemberManagementApp(QMainWindow):
                 return
 
             # 学年ごとにデータをグループ化
-            grade_groups = {}
-            for item in self.data:
-                grade = item['grade']
-                if not grade:
-                    grade = ""
-
-                if grade not in grade_groups:
-                    grade_groups[grade] = []
-
-                grade_groups[grade].append(item)
+            grade_groups = group_members_by_grade(self.data)
+            if grades is not None:
+                grade_groups = {grade: items for grade, items in grade_groups.items() if grade in grades}
 
             # 進捗ダイアログ
-            progress = QProgressDialog("PDFを生成中...", "キャンセル", 0, len(grade_groups), self)
+            progress = QProgressDialog("変更を確認中...", "キャンセル", 0, 0, self)
             progress.setWindowTitle("PDF出力")
             progress.setWindowModality(Qt.WindowModal)
             progress.show()
 
-            success_count = 0
+            # 取得できなかった写真のURL（同じ出力の中では取得し直さない）
+            failed_urls = set()
 
-            for i, (grade, items) in enumerate(grade_groups.items()):
-                # キャンセルされた場合
+            def prefetch_photos(urls, label):
+                """写真を並列に取得してディスクキャッシュに入れる（キャンセルされた場合はFalse）
+
+                取得できなかったURLはfailed_urlsに加える。
+                """
+                if not urls:
+                    return True
+                progress.setMaximum(len(urls))
+                progress.setValue(0)
+
+                def show_progress(completed, total):
+                    # 最大値に達するとダイアログが自動で閉じるため、続く段階のために手前で止める
+                    progress.setValue(min(completed, total - 1))
+                    progress.setLabelText(f"{label}... ({completed}/{total}枚)")
+                    QApplication.processEvents()
+
+                started = time.perf_counter()
+                failed = prefetch_images(self.get_image_data, urls, self.pdf_prefetch_concurrency,
+                                         on_progress=show_progress, is_canceled=progress.wasCanceled)
                 if progress.wasCanceled():
-                    break
+                    return False
+                failed_urls.update(failed)
+                print(f"PDF出力: {label}: {len(urls)}枚（失敗{len(failed)}枚、"
+                      f"同時{self.pdf_prefetch_concurrency}件, {time.perf_counter() - started:.2f}秒）")
+                return True
+
+            # 内容のハッシュが分からない写真（初めて使う写真など）だけを先に並列で取得し、
+            # 指紋の計算では1枚ずつネットワークを待たないようにする
+            photo_urls = unique_photo_urls(item for items in grade_groups.values() for item in items)
+            unknown_urls = [url for url in photo_urls if self.image_loader.known_content_hash(url) is None]
+            if not prefetch_photos(unknown_urls, "変更の確認に使う写真を取得"):
+                return
 
+            # 学年ごとの指紋を計算し、前回の出力から変わっていない学年は作り直さない
+            # （ここからはディスクキャッシュだけを使い、ネットワークは使わない）
+            progress.setMaximum(len(grade_groups))
+            progress.setValue(0)
+            settings = profile_export_settings(self.pdf_font_path, self.pdf_image_dpi, self.pdf_jpeg_quality,
+                                               self.pdf_renderer)
+            fingerprints = {}
+            for i, (grade, items) in enumerate(grade_groups.items()):
+                if progress.wasCanceled():
+                    return
                 progress.setValue(i)
-                progress.setLabelText(f"{grade}のPDFを生成中...")
+                progress.setLabelText(f"{grade}の変更を確認中...")
+                fingerprints[grade] = grade_fingerprint(grade, items, self.image_loader.cached_content_hash, settings)
+
+            # 作り直す学年の出力ジョブ (学年, 会員リスト, 出力ファイル)
+            timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+            jobs, reused = plan_profile_export(save_dir, grade_groups, fingerprints, timestamp)
+            if reused:
+                print(f"PDF出力: 変更のない学年をスキップしました ({', '.join(reused)})")
+
+            # 作り直す学年の写真のうち、キャッシュにないもの（容量の上限で削除されたものなど）を
+            # 並列で取得しておく。レイアウトはキャッシュだけを使い、取得できなかった写真は代わりの枠を描く
+            missing_urls = [url for url in unique_photo_urls(item for _, items, _ in jobs for item in items)
+                            if url not in failed_urls and not self.image_loader.is_cached(url)]
+            if not prefetch_photos(missing_urls, "PDFに載せる写真を取得"):
+                return
 
-                # ファイル名を設定
-                timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-                safe_grade = re.sub(r'[\\/*?:"<>|]', '', grade)  # ファイル名に使えない文字を削除
-                output_file = os.path.join(save_dir, f"プロフィール_{safe_grade}_{timestamp}.pdf")
+            progress.setMaximum(len(jobs))
+            progress.setValue(0)
+            progress.setLabelText("PDFを生成中...")
 
-                # PDFを生成
-                try:
-                    self.generate_profile_pdf(output_file, grade, items)
-                    success_count += 1
-                except Exception as e:
-                    QMessageBox.warning(
-                        self,
-                        "警告",
-                        f"{grade}のPDF生成中にエラーが発生しました: {str(e)}\n処理を続行します。"
-                    )
-                    print(f"PDF生成エラー ({grade}): {e}")
-                    continue
+            # 取得済みの写真でPDFを生成（失敗した学年はまとめて報告する）
+            if self.parallel_pdf_export and len(jobs) > 1:
+                success_count, errors, image_stats = self.run_pdf_jobs_in_processes(jobs, progress)
+            else:
+                success_count, errors, image_stats = self.run_pdf_jobs(jobs, progress)
+            print(f"PDF出力: {format_image_stats(image_stats)}")
+
+            canceled = progress.wasCanceled()
+            progress.setValue(len(jobs))
+
+            # 生成できた学年の指紋を記録する
+            failed_grades = {grade for grade, _ in errors}
+            record_profile_exports(save_dir, [
+                (grade, output_file) for grade, _, output_file in jobs
+                if grade not in failed_grades and os.path.exists(output_file)
+            ], fingerprints)
 
-            progress.setValue(len(grade_groups))
+            # 出力できた学年は変更済みの記録から外す（削除で空になった学年も含む）
+            if not canceled:
+                self.changed_grades -= (grades if grades is not None else set(self.changed_grades)) - failed_grades
+
+            error_text = ""
+            if errors:
+                error_text = "\n\n以下の学年でエラーが発生しました:\n" + "\n".join(
+                    f"・{grade}: {error}" for grade, error in errors)
+
+            reused_text = ""
+            if reused:
+                reused_text = f"\n変更のない{len(reused)}学年は前回のPDFをそのまま使用しました。"
 
             if success_count > 0:
+                QMessageBox.information(
+                    self,
+                    "完了" if not canceled else "キャンセル",
+                    f"{success_count}/{len(jobs)}学年のPDF出力が完了しました。{reused_text}\n保存先: {save_dir}\n"
+                    f"{format_image_stats(image_stats)}{error_text}"
+                )
+            elif not jobs:
                 QMessageBox.information(
                     self,
                     "完了",
-                    f"{success_count}/{len(grade_groups)}学年のPDF出力が完了しました。\n保存先: {save_dir}"
+                    f"前回の出力から変更のある学年はありませんでした。{reused_text}\n保存先: {save_dir}"
                 )
-            else:
+            elif not canceled:
                 QMessageBox.critical(
                     self,
                     "エラー",
-                    "PDF出力に失敗しました。システム環境を確認してください。"
+                    f"PDF出力に失敗しました。システム環境を確認してください。{error_text}"
                 )
 
         except Exception as e:
             QMessageBox.critical(self, "エラー", f"PDF出力中にエラーが発生しました:\n{str(e)}")
             print(f"PDF出力全体エラー: {e}")
 
+    def run_pdf_jobs(self, jobs, progress):
+        """学年ごとのPDFを順番に生成し、(成功数, [(学年, エラー)], 写真の埋め込み統計) を返す"""
+        success_count = 0
+        errors = []
+        image_stats = {}
+
+        # 学年をまたいで同じ写真を使う会員がいるため、生成器（縮小済みの写真）は全学年で共有する
+        generator = self.create_pdf_generator()
+
+        for i, (grade, items, output_file) in enumerate(jobs):
+            # キャンセルされた場合
+            if progress.wasCanceled():
+                break
+
+            progress.setValue(i)
+            progress.setLabelText(f"{grade}のPDFを生成中...")
+
+            try:
+                merge_image_stats(image_stats, generator.generate_profile_pdf(output_file, grade, items))
+                success_count += 1
+            except Exception as e:
+                print(f"PDF生成エラー ({grade}): {e}")
+                errors.append((grade, e))
+
+        return success_count, errors, image_stats
+
+    def run_pdf_jobs_in_processes(self, jobs, progress):
+        """学年ごとのPDFをプロセスプールで並列に生成し、(成功数, [(学年, エラー)], 写真の埋め込み統計) を返す"""
+        success_count = 0
+        errors = []
+        image_stats = {}
+
+        max_workers = min(len(jobs), os.cpu_count() or 1)
+        # 先読み・CSV読み込み・絞り込みのスレッドがロックを持ったままforkされると
+        # 子プロセスが固まることがあるため、spawnで新しいプロセスを起動する
+        executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        futures = {
+            executor.submit(generate_grade_pdf_job, output_file, grade, items, self.pdf_font_path,
+                            self.pdf_image_dpi, self.pdf_jpeg_quality, self.pdf_renderer): grade
+            for grade, items, output_file in jobs
+        }
+        pending = set(futures)
+        progress.setLabelText(f"{len(jobs)}学年のPDFを{max_workers}プロセスで生成中...")
+
+        try:
+            while pending:
+                # キャンセルされた場合は未開始の学年を取り消す（実行中の学年は最後まで生成される）
+                if progress.wasCanceled():
+                    for future in pending:
+                        future.cancel()
+                    break
+
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in done:
+                    grade = futures[future]
+                    try:
+                        stats = future.result()
+                        elapsed = stats.pop('elapsed')
+                        merge_image_stats(image_stats, stats)
+                        success_count += 1
+                        print(f"PDF生成完了 ({grade}): {elapsed:.2f}秒")
+                    except Exception as e:
+                        print(f"PDF生成エラー ({grade}): {e}")
+                        errors.append((grade, e))
+
+                if done:
+                    completed = len(jobs) - len(pending)
+                    progress.setValue(completed)
+                    progress.setLabelText(f"PDFを生成中... ({completed}/{len(jobs)}学年)")
+
+                QApplication.processEvents()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return success_count, errors, image_stats
+
+    def set_canvas_pdf_renderer(self, enabled):
+        """カードをcanvasに直接描画する高速な描画方式を切り替える"""
+        self.pdf_renderer = 'canvas' if enabled else 'platypus'
+        self.statusBar().showMessage("PDFをcanvasで直接描画します" if enabled else "PDFをplatypusのレイアウトで生成します")
+
+    def set_parallel_pdf_export(self, enabled):
+        """学年ごとの並列PDF生成を切り替える"""
+        self.parallel_pdf_export = enabled
+        self.statusBar().showMessage("PDFを学年ごとに並列で生成します" if enabled else "PDFを順番に生成します")
+
     def select_font_file(self):
         """フォントファイル選択ダイアログを表示"""
         options = QFileDialog.Options()
@@ -270,7 +3202,7 @@ class MemberManagementApp(QMainWindow):
             # フォントファイルの拡張子をチェック
             if fileName.lower().endswith(('.ttf', '.otf')):
                 # フォント設定ファイルパス
-                font_config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "font_config.txt")
+                font_config_path = FONT_CONFIG_PATH
 
                 # 設定ファイルに保存
                 try:
@@ -279,7 +3211,8 @@ class MemberManagementApp(QMainWindow):
 
                     # フォントを再登録
                     try:
-                        pdfmetrics.registerFont(TTFont('JapaneseFont', fileName))
+                        register_japanese_font(fileName)
+                        self.pdf_font_path = fileName
                         self.statusBar().showMessage(f"フォントを設定しました: {os.path.basename(fileName)}")
                         QMessageBox.information(
                             self,
@@ -329,16 +3262,34 @@ class MemberManagementApp(QMainWindow):
         self.csv_button.clicked.connect(self.open_csv_file)
         filter_layout.addWidget(self.csv_button)
 
+        # 再読み込みボタン（変更のあった行だけを反映する）
+        reload_button = QPushButton("再読み込み")
+        reload_button.clicked.connect(self.reload_csv_file)
+        filter_layout.addWidget(reload_button)
+
         # PDF関連ボタン用のメニュー
         pdf_button = QPushButton("PDF")
         pdf_menu = QMenu(self)
 
         pdf_export_action = pdf_menu.addAction("PDF出力")
-        pdf_export_action.triggered.connect(self.export_to_pdf)
+        pdf_export_action.triggered.connect(lambda: self.export_to_pdf())
+
+        pdf_changed_action = pdf_menu.addAction("変更のあった学年だけ出力")
+        pdf_changed_action.triggered.connect(self.export_changed_grades_to_pdf)
 
         pdf_font_action = pdf_menu.addAction("フォント設定")
         pdf_font_action.triggered.connect(self.select_font_file)
 
+        pdf_parallel_action = pdf_menu.addAction("学年ごとに並列で生成")
+        pdf_parallel_action.setCheckable(True)
+        pdf_parallel_action.setChecked(self.parallel_pdf_export)
+        pdf_parallel_action.toggled.connect(self.set_parallel_pdf_export)
+
+        pdf_canvas_action = pdf_menu.addAction("高速な描画方式を使う")
+        pdf_canvas_action.setCheckable(True)
+        pdf_canvas_action.setChecked(self.pdf_renderer == 'canvas')
+        pdf_canvas_action.toggled.connect(self.set_canvas_pdf_renderer)
+
         pdf_button.setMenu(pdf_menu)
         filter_layout.addWidget(pdf_button)
 
@@ -358,23 +3309,31 @@ class MemberManagementApp(QMainWindow):
         search_label = QLabel("検索:")
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("名前や四字熟語で検索...")
-        self.search_input.textChanged.connect(self.apply_filters)
+        self.search_input.textChanged.connect(self.filter_scheduler.schedule)
         filter_layout.addWidget(search_label)
         filter_layout.addWidget(self.search_input)
 
         main_layout.addWidget(filter_frame)
 
-        # テーブルウィジェット
-        self.table = QTableWidget()
-        self.table.setColumnCount(6)
-        self.table.setHorizontalHeaderLabels(["詳細", "写真", "ご本人名", "お子様名", "高等部二年生保護者の皆様へご挨拶","お住まいの地域"])
-        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeToContents)
-        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeToContents)
+        # 会員一覧（モデル/ビュー方式。表示されている行だけが描画される）
+        self.table_model = MemberTableModel(self.thumbnail_for, self)
+        self.table_delegate = MemberTableDelegate(self)
+        self.table_delegate.details_clicked.connect(self.toggle_details)
+
+        self.table = QTableView()
+        self.table.setModel(self.table_model)
+        self.table.setItemDelegate(self.table_delegate)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Fixed)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Fixed)
+        self.table.horizontalHeader().resizeSection(0, 70)
+        self.table.horizontalHeader().resizeSection(1, TABLE_ROW_HEIGHT + 6)
         self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
         self.table.horizontalHeader().setSectionResizeMode(3, QHeaderView.Stretch)
         self.table.horizontalHeader().setSectionResizeMode(4, QHeaderView.ResizeToContents)
         self.table.horizontalHeader().setSectionResizeMode(5, QHeaderView.ResizeToContents)
         self.table.horizontalHeader().sectionClicked.connect(self.sort_table)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(TABLE_ROW_HEIGHT)
         self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.table.verticalHeader().setVisible(False)
@@ -382,859 +3341,574 @@ class MemberManagementApp(QMainWindow):
         main_layout.addWidget(self.table)
 
         # 詳細表示エリア
-        self.details_area = QScrollArea()
-        self.details_area.setWidgetResizable(True)
-        self.details_area.setVisible(False)
-        self.details_widget = QWidget()
-        self.details_layout = QGridLayout(self.details_widget)
-        self.details_area.setWidget(self.details_widget)
-
-        main_layout.addWidget(self.details_area)
-
-        # ステータスバー
-        self.statusBar().showMessage("データロード準備完了")
-
-    def load_data(self, filename):
-        try:
-            # ファイルの存在チェック
-            if not os.path.exists(filename):
-                self.statusBar().showMessage(f"ファイルが見つかりません: {filename}")
-                return
-
-            with open(filename, 'r', encoding='utf-8') as f:
-                csv_reader = csv.DictReader(f)
-                self.data = []
-                for row in csv_reader:
-                    processed_row = {
-                        'parent_name': row.get('回答者のお名前', ''),
-                        'child_name': row.get('お子様のお名前', ''),
-                        'grade': row.get('お子様の学年', ''),
-                        'child_phrase': row.get('高等部二年生保護者の皆様へご挨拶', ''),
-                        'parent_phrase': row.get('お住まいの地域', ''),
-                        'photo_url': row.get('お子様と回答者の写真', '')
-                    }
-                    self.data.append(processed_row)
-
-                # 学年リストを更新
-                grades = set(item['grade'] for item in self.data if item['grade'])
-                self.grade_combo.clear()
-                self.grade_combo.addItem("すべて", "all")
-                for grade in sorted(grades):
-                    self.grade_combo.addItem(grade, grade)
-
-                # 初期表示
-                self.filtered_data = self.data.copy()
-                self.update_table()
-                self.statusBar().showMessage(f"データ読み込み完了: {filename} ({len(self.data)}件)")
-
-                # 現在のファイルパスを更新
-                self.current_csv_path = filename
-                self.setWindowTitle(f"会員管理アプリケーション - {os.path.basename(filename)}")
-        except Exception as e:
-            self.statusBar().showMessage(f"データ読み込みエラー: {str(e)}")
-            QMessageBox.critical(self, "エラー", f"CSVファイルの読み込み中にエラーが発生しました:\n{str(e)}")
-
-    def open_csv_file(self):
-        """CSVファイル選択ダイアログを開く"""
-        options = QFileDialog.Options()
-        fileName, _ = QFileDialog.getOpenFileName(
-            self,
-            "CSVファイルを選択",
-            os.path.dirname(self.current_csv_path),  # 前回のディレクトリを開く
-            "CSVファイル (*.csv);;すべてのファイル (*)",
-            options=options
-        )
-
-        if fileName:
-            # 選択されたファイルを読み込む
-            self.load_data(fileName)
-
-    def apply_filters(self):
-        # 学年フィルター
-        grade_filter = self.grade_combo.currentData()
-
-        # 検索フィルター
-        search_term = self.search_input.text().lower()
-
-        # フィルター適用
-        self.filtered_data = []
-        for item in self.data:
-            # 学年フィルター
-            if grade_filter != "all" and item['grade'] != grade_filter:
-                continue
-
-            # 検索フィルター
-            if search_term and not (
-                    search_term in item['parent_name'].lower() or
-                    search_term in item['child_name'].lower() or
-                    search_term in item['child_phrase'].lower() or
-                    search_term in item['parent_phrase'].lower()
-            ):
-                continue
-
-            self.filtered_data.append(item)
-
-        # 現在のソート条件で並べ替え
-        self.sort_data()
-
-        # テーブル更新
-        self.update_table()
-        self.statusBar().showMessage(f"表示: {len(self.filtered_data)}/{len(self.data)}件")
-
-    def sort_data(self):
-        column_map = {
-            2: 'parent_name',
-            3: 'child_name',
-            4: 'grade',
-            5: 'next_year_candidate'
-        }
-
-        if self.sort_column in column_map:
-            key = column_map[self.sort_column]
-            reverse = (self.sort_order == Qt.DescendingOrder)
-            self.filtered_data.sort(key=lambda x: x[key], reverse=reverse)
-
-    def sort_table(self, column_index):
-        if column_index in [2, 3, 4, 5]:  # ソート可能な列
-            if self.sort_column == column_index:
-                # 同じ列をクリックした場合は昇順/降順を切り替え
-                self.sort_order = Qt.DescendingOrder if self.sort_order == Qt.AscendingOrder else Qt.AscendingOrder
-            else:
-                # 異なる列の場合は昇順に設定
-                self.sort_column = column_index
-                self.sort_order = Qt.AscendingOrder
-
-            # データを並べ替え
-            self.sort_data()
-
-            # テーブル更新
-            self.update_table()
-
-    def update_table(self):
-        self.table.setRowCount(0)  # テーブルをクリア
-
-        for i, item in enumerate(self.filtered_data):
-            row_position = self.table.rowCount()
-            self.table.insertRow(row_position)
-
-            # 詳細ボタン
-            detail_btn = QPushButton("詳細")
-            detail_btn.clicked.connect(lambda checked, row=i: self.toggle_details(row))
-            self.table.setCellWidget(row_position, 0, detail_btn)
-
-            # 写真
-            photo_label = QLabel()
-            photo_label.setAlignment(Qt.AlignCenter)
-            if item['photo_url']:
-                # この部分は実際の環境で画像を読み込む処理に置き換え
-                pixmap = self.load_image_from_url(item['photo_url'])
-                if not pixmap.isNull():
-                    photo_label.setPixmap(pixmap)
-                else:
-                    photo_label.setText("読み込みエラー")
-            else:
-                photo_label.setText("画像なし")
-            photo_label.setFixedSize(70, 70)
-            self.table.setCellWidget(row_position, 1, photo_label)
-
-            # 親の名前
-            parent_name_item = QTableWidgetItem(item['parent_name'])
-            self.table.setItem(row_position, 2, parent_name_item)
-
-            # 子供の名前
-            child_name_item = QTableWidgetItem(item['child_name'])
-            self.table.setItem(row_position, 3, child_name_item)
-
-            # 学年
-            grade_item = QTableWidgetItem(item['grade'])
-            grade_item.setTextAlignment(Qt.AlignCenter)
-            self.table.setItem(row_position, 4, grade_item)
-            #
-            # # 次年度候補
-            # candidate_item = QTableWidgetItem(item['next_year_candidate'])
-            # candidate_item.setTextAlignment(Qt.AlignCenter)
-            # self.table.setItem(row_position, 5, candidate_item)
-
-        self.table.resizeRowsToContents()
-
-    def toggle_details(self, row_index):
-        # 詳細表示を切り替え
-        if row_index in self.expanded_rows:
-            self.expanded_rows.pop(row_index)
-            self.details_area.setVisible(False)
-        else:
-            self.expanded_rows = {row_index: True}  # 他の行の詳細表示をクリア
-            self.show_details(row_index)
-
-    def show_details(self, row_index):
-        item = self.filtered_data[row_index]
-
-        # 詳細エリアをクリア
-        for i in reversed(range(self.details_layout.count())):
-            self.details_layout.itemAt(i).widget().setParent(None)
-
-        # 詳細情報を追加
-        self.details_layout.addWidget(QLabel("<b>基本情報</b>"), 0, 0)
-        self.details_layout.addWidget(QLabel(f"<b>お子様の名前:</b> {item['child_name']}"), 1, 0)
-        self.details_layout.addWidget(QLabel(f"<b>ご挨拶:</b> {item['child_phrase']}"), 2, 0)
-        self.details_layout.addWidget(QLabel(f"<b>お住まいの地域:</b> {item['parent_phrase']}"), 3, 0)
-
-        # 追加情報がある場合のみ表示（エラー防止）
-        if 'can_participate' in item:
-            self.details_layout.addWidget(QLabel(f"<b>委員会運営参加:</b> {item['can_participate']}"), 4, 0)
-
-        self.details_layout.addWidget(QLabel("<b>詳細情報</b>"), 0, 1)
-
-        # 追加情報がある場合のみ表示（エラー防止）
-        if 'reason' in item:
-            self.details_layout.addWidget(QLabel(f"<b>理由:</b> {item.get('reason') or '-'}"), 1, 1)
-
-        if 'impression' in item:
-            # 所感は複数行の可能性があるのでQTextEditで表示
-            impression_label = QLabel(f"<b>委員会への所感:</b> {item.get('impression') or '-'}")
-            impression_label.setWordWrap(True)
-            self.details_layout.addWidget(impression_label, 2, 1, 2, 1)
-
-        self.details_area.setVisible(True)
-
-
-
-    def convert_google_drive_url(self, url):
-        """GoogleドライブのURLを直接アクセス可能なURLに変換する（最新版）"""
-        if not url:
-            return ''
-
-        # ファイルIDを抽出
-        file_id = None
-
-        # 'open?id=' パターンの場合
-        if 'open?id=' in url:
-            file_id = url.split('open?id=')[1].split('&')[0] if '&' in url.split('open?id=')[1] else url.split('open?id=')[1]
-
-        # 'file/d/' パターンの場合
-        elif 'file/d/' in url:
-            file_id = url.split('file/d/')[1].split('/')[0] if '/' in url.split('file/d/')[1] else url.split('file/d/')[1]
-
-        # 'id=' パターンの場合
-        elif 'id=' in url:
-            file_id = url.split('id=')[1].split('&')[0] if '&' in url.split('id=')[1] else url.split('id=')[1]
-
-        # その他のパターンでIDを探す
-        else:
-            # GoogleドライブのIDは通常25-33文字の英数字とハイフン
-            import re
-            matches = re.findall(r'[-\w]{25,}', url)
-            if matches:
-                file_id = matches[0]
-
-        if not file_id:
-            print(f"警告: GoogleドライブのファイルIDを抽出できませんでした: {url}")
-            return url
-
-        # 2023-2025年版の複数のアクセス方法を試す (優先順位あり)
-        return f"https://lh3.googleusercontent.com/d/{file_id}"
-
-    def fetch_image_with_retry(self, url, max_retries=3):
-        """複数の方法を試して画像を取得する"""
-        original_url = url
-
-        # 取得を試みるURL形式のリスト
-        file_id = None
-
-        # ファイルIDを抽出
-        if 'open?id=' in url:
-            file_id = url.split('open?id=')[1].split('&')[0] if '&' in url.split('open?id=')[1] else url.split('open?id=')[1]
-        elif 'file/d/' in url:
-            file_id = url.split('file/d/')[1].split('/')[0] if '/' in url.split('file/d/')[1] else url.split('file/d/')[1]
-        elif 'id=' in url:
-            file_id = url.split('id=')[1].split('&')[0] if '&' in url.split('id=')[1] else url.split('id=')[1]
-        else:
-            import re
-            matches = re.findall(r'[-\w]{25,}', url)
-            if matches:
-                file_id = matches[0]
-
-        if not file_id:
-            print(f"警告: GoogleドライブのファイルIDを抽出できませんでした: {url}")
-            return None
-
-        # 試すURLのパターン
-        url_patterns = [
-            f"https://lh3.googleusercontent.com/d/{file_id}",
-            f"https://drive.usercontent.google.com/download?id={file_id}&export=view",
-            f"https://drive.google.com/uc?export=view&id={file_id}",
-            f"https://drive.google.com/uc?id={file_id}",
-            f"https://drive.google.com/thumbnail?id={file_id}&sz=w2000"
-        ]
-
-        headers_list = [
-            {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-                'Referer': 'https://drive.google.com/'
-            },
-            {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.1 Safari/605.1.15',
-                'Accept': 'image/webp,image/png,image/svg+xml,image/*;q=0.8',
-                'Sec-Fetch-Site': 'cross-site',
-                'Sec-Fetch-Mode': 'no-cors',
-                'Sec-Fetch-Dest': 'image'
-            }
-        ]
-
-        import urllib.request
-        from urllib.error import HTTPError, URLError
-        import time
-        import random
-
-        for retry in range(max_retries):
-            # 各URLパターンを試す
-            for url_pattern in url_patterns:
-                # 各ヘッダーセットを試す
-                for headers in headers_list:
-                    try:
-                        req = urllib.request.Request(url_pattern, headers=headers)
-                        with urllib.request.urlopen(req, timeout=15) as response:
-                            image_data = response.read()
-
-                            if image_data and len(image_data) > 100:  # 最小サイズチェック
-                                print(f"成功: {url_pattern} (試行 {retry+1}/{max_retries})")
-                                return image_data
-                            else:
-                                print(f"画像データが不十分: {url_pattern}")
-                    except (HTTPError, URLError) as e:
-                        print(f"失敗 ({e}): {url_pattern}")
-                    except Exception as e:
-                        print(f"例外: {e} for {url_pattern}")
-
-                    # アクセス制限回避のための短い待機
-                    time.sleep(random.uniform(0.5, 1.5))
-
-            # すべてのパターンが失敗した場合、次の再試行前に少し長く待機
-            if retry < max_retries - 1:
-                time.sleep(random.uniform(1.0, 3.0))
-
-        print(f"すべての試行が失敗しました: {original_url}")
-        return None
-
-    def load_image_from_url(self, url):
-        """URLから画像をロードする（複数の方法を試す改良版）"""
-        # キャッシュにあれば使用
-        if url in self.image_cache:
-            return self.image_cache[url]
-
-        try:
-            if not url or url.strip() == '':
-                print("空のURLが指定されました")
-                return QPixmap()
-
-            self.statusBar().showMessage(f"画像読み込み中: {url}")
-
-            # 複数の方法で画像データの取得を試みる
-            image_data = self.fetch_image_with_retry(url)
-
-            if not image_data:
-                print(f"画像を取得できませんでした: {url}")
-                return QPixmap()
-
-            # ----- QImageでロード -----
-            from PyQt5.QtGui import QImage
-            from PyQt5.QtCore import QByteArray
-
-            # バイトデータをQByteArrayに変換
-            byte_array = QByteArray(image_data)
-
-            # QImageを作成
-            image = QImage()
-            loaded = image.loadFromData(byte_array)
-
-            if loaded and not image.isNull():
-                # 正常にロードできた場合
-                image = image.scaled(64, 64, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                pixmap = QPixmap.fromImage(image)
-                self.image_cache[url] = pixmap
-                self.statusBar().showMessage(f"画像読み込み完了: {url}")
-                return pixmap
-
-            # ----- 代替手段: 一時ファイル経由 -----
-            import tempfile
-            import os
-
-            # 一時ファイルに保存して読み込み
-            temp_file = tempfile.NamedTemporaryFile(delete=False)
-            temp_path = temp_file.name
-            temp_file.write(image_data)
-            temp_file.close()
-
-            # 拡張子の追加（メディアタイプを検出）
-            from PIL import Image
-            from io import BytesIO
-
-            try:
-                pil_image = Image.open(BytesIO(image_data))
-                img_format = pil_image.format
-
-                # 適切な拡張子を持つ新しい一時ファイル
-                new_temp_path = temp_path + '.' + (img_format.lower() if img_format else 'jpg')
-                os.rename(temp_path, new_temp_path)
-                temp_path = new_temp_path
-
-                pil_image.close()
-            except Exception as pil_err:
-                print(f"PILでの画像形式検出エラー: {pil_err}")
-
-            # QPixmapで読み込み
-            pixmap = QPixmap(temp_path)
-
-            # 一時ファイルを削除
-            try:
-                os.unlink(temp_path)
-            except Exception as e:
-                print(f"一時ファイル削除エラー: {e}")
-
-            if not pixmap.isNull():
-                # リサイズ
-                pixmap = pixmap.scaled(64, 64, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-
-                # キャッシュに保存
-                self.image_cache[url] = pixmap
-                self.statusBar().showMessage(f"画像読み込み完了（代替手段）: {url}")
-                return pixmap
+        self.details_area = QScrollArea()
+        self.details_area.setWidgetResizable(True)
+        self.details_area.setVisible(False)
+        self.details_widget = QWidget()
+        self.details_layout = QGridLayout(self.details_widget)
+        self.details_area.setWidget(self.details_widget)
 
-            # ----- 代替手段2: PILを使用した変換 -----
-            try:
-                from PIL import Image
-                from io import BytesIO
-                import numpy as np
-                from PyQt5.QtGui import QImage, qRgb
+        main_layout.addWidget(self.details_area)
 
-                # PILで画像を開く
-                pil_image = Image.open(BytesIO(image_data))
+        # ステータスバー
+        self.statusBar().showMessage("データロード準備完了")
 
-                # RGBAに変換
-                pil_image = pil_image.convert("RGBA")
+    def load_data(self, filename, reload=False):
+        """CSVファイルの読み込みを開始する
+
+        読み込み済みの名簿と同じファイル（またはreload=True）の場合は再読み込みとして
+        扱い、読み込み中も今の表示を残したまま、完了時に差分（追加・削除・変更）
+        だけを反映する。それ以外の場合は、行を読み込んだ分から表に追加する。
+        """
+        # ファイルの存在チェック
+        if not os.path.exists(filename):
+            self.statusBar().showMessage(f"ファイルが見つかりません: {filename}")
+            STARTUP_TIMELINE.mark('CSVなし')
+            return
 
-                # PILからnumpy配列に変換
-                img_array = np.array(pil_image)
+        same_file = os.path.abspath(filename) == os.path.abspath(self.current_csv_path)
+        if self.data and not self.is_streaming_rows() and (reload or same_file):
+            self.csv_loader.cancel()
+            generation = self.csv_loader.load(filename)
+            self.csv_load_state = {
+                'generation': generation,
+                'filename': filename,
+                'started_at': time.perf_counter(),
+                'reload': True,
+                'items': [],
+            }
+            self.statusBar().showMessage(f"データ再読み込み中: {filename}")
+            return
 
-                # numpy配列からQImageに変換
-                height, width, channels = img_array.shape
-                bytes_per_line = channels * width
+        # 前のファイルの読み込み・先読み・絞り込みは取り消す
+        self.csv_loader.cancel()
+        self.filter_scheduler.cancel()
+        self.image_prefetcher.cancel_all()
+        self.image_errors.clear()
+        self.sync_rows_on_filter = False
 
-                # RGBA形式のQImageを作成
-                qimg = QImage(img_array.data, width, height, bytes_per_line, QImage.Format_RGBA8888)
+        # 別の名簿の変更は、これから読み込む名簿のPDFには関係しない
+        self.changed_grades.clear()
 
-                # QImageからQPixmapに変換
-                pixmap = QPixmap.fromImage(qimg)
+        # 読み込み中は空のインデックスのまま（完了時に差し替えて絞り込む）
+        self.data = []
+        self.search_index = MemberSearchIndex()
+        self.sort_ranks = MemberSortRanks()
+        self.filtered_data = []
+        self.update_table()
 
-                if not pixmap.isNull():
-                    # リサイズ
-                    pixmap = pixmap.scaled(64, 64, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        self.grade_combo.blockSignals(True)
+        self.grade_combo.clear()
+        self.grade_combo.addItem("すべて", "all")
+        self.grade_combo.blockSignals(False)
+
+        generation = self.csv_loader.load(filename)
+        self.csv_load_state = {
+            'generation': generation,
+            'filename': filename,
+            'started_at': time.perf_counter(),
+            'reload': False,
+            'grades': set(),
+        }
+        self.statusBar().showMessage(f"データ読み込み中: {filename}")
 
-                    # キャッシュに保存
-                    self.image_cache[url] = pixmap
-                    self.statusBar().showMessage(f"画像読み込み完了（PIL変換）: {url}")
-                    return pixmap
+    def reload_csv_file(self):
+        """現在のCSVファイルを読み込み直し、変更のあった行だけを反映する"""
+        self.load_data(self.current_csv_path, reload=True)
 
-            except Exception as pil_err:
-                print(f"PIL変換エラー: {pil_err}")
+    def is_streaming_rows(self):
+        """新しい名簿の行を読み込みながら表に追加している最中かどうか"""
+        return self.csv_load_state is not None and not self.csv_load_state['reload']
 
-            # すべての方法が失敗した場合
-            print(f"すべての画像読み込み方法が失敗: {url}")
-            return QPixmap()
+    def on_csv_chunk_loaded(self, generation, items, bytes_read, total_bytes):
+        """読み込んだ行を表に追加し、学年リストと進捗を更新する"""
+        state = self.csv_load_state
+        if not self.csv_loader.is_current(generation) or state is None:
+            return
 
-        except Exception as e:
-            print(f"画像読み込み全体エラー: {str(e)} for URL: {url}")
-            self.statusBar().showMessage(f"画像読み込みエラー: {url}")
-            return QPixmap()  # 空の QPixmap を返す
+        if state['reload']:
+            # 再読み込みでは表示はそのままにして、完了時に差分を反映する
+            state['items'].extend(items)
+            percent = 100 * bytes_read / total_bytes if total_bytes else 100
+            self.statusBar().showMessage(f"データ再読み込み中: {len(state['items'])}件 ({percent:.0f}%)")
+            return
 
-    def generate_profile_pdf(self, output_file, grade, items):
-        """プロフィール形式のPDFを生成する（日本語フォント対応、A4ページを2列×2行に分割）"""
-        # PDF作成準備（余白を少なく設定）
-        doc = SimpleDocTemplate(
-            output_file,
-            pagesize=A4,
-            leftMargin=5 * mm,    # 余白を5mmに縮小
-            rightMargin=5 * mm,   # 余白を5mmに縮小
-            topMargin=5 * mm,     # 余白を5mmに縮小
-            bottomMargin=5 * mm   # 余白を5mmに縮小
+        self.data.extend(items)
+        # 読み込み中は到着順に表示する（絞り込み・並べ替えは完了時に行う）
+        self.table_model.append_members(items)
+        STARTUP_TIMELINE.mark('CSVの最初の行を表示')
+
+        # 新しく出てきた学年だけを並び順の位置に追加する
+        new_grades = {item.grade for item in items if item.grade} - state['grades']
+        if new_grades:
+            state['grades'] |= new_grades
+            self.grade_combo.blockSignals(True)
+            for grade in sorted(new_grades):
+                position = 1 + sorted(state['grades']).index(grade)
+                self.grade_combo.insertItem(position, grade, grade)
+            self.grade_combo.blockSignals(False)
+
+        # 読み込んだ分の写真から先読みを始める
+        self.image_prefetcher.prefetch(item.photo_url for item in items)
+
+        elapsed = max(time.perf_counter() - state['started_at'], 1e-6)
+        percent = 100 * bytes_read / total_bytes if total_bytes else 100
+        self.statusBar().showMessage(
+            f"データ読み込み中: {len(self.data)}件 ({percent:.0f}%, "
+            f"{len(self.data) / elapsed:.0f}件/秒, {bytes_read / elapsed / 1048576:.1f}MB/秒)"
         )
 
-        # スタイル定義
-        styles = getSampleStyleSheet()
-
-        # 日本語フォントを使用したスタイル
-        # 'JapaneseFont'が登録されていれば使用、なければ代替フォント
-        font_name = 'JapaneseFont' if 'JapaneseFont' in pdfmetrics.getRegisteredFontNames() else 'Helvetica'
+    def on_csv_load_finished(self, generation, search_index, sort_ranks):
+        """読み込み完了後に検索インデックスを差し替え、現在の条件で表示し直す"""
+        state = self.csv_load_state
+        if not self.csv_loader.is_current(generation) or state is None:
+            return
+        self.csv_loader.loading = False
+        self.csv_load_state = None
+        filename = state['filename']
 
-        japanese_style = ParagraphStyle(
-            'JapaneseStyle',
-            parent=styles['Normal'],
-            fontName=font_name,
-            fontSize=10,
-            leading=12,
-            wordWrap='CJK'
-        )
+        if state['reload']:
+            self.apply_reloaded_data(state, search_index, sort_ranks)
+            return
 
-        japanese_heading = ParagraphStyle(
-            'JapaneseHeading',
-            parent=styles['Heading1'],
-            fontName=font_name,
-            fontSize=14,
-            leading=16,
-            wordWrap='CJK'
-        )
+        self.search_index = search_index
+        self.sort_ranks = sort_ranks
 
-        # 内容作成
-        elements = []
+        # 新しい名簿で参照されない画像をメモリキャッシュから外す
+        if self.prune_image_cache_on_reload:
+            removed = self.image_cache.retain(item.photo_url for item in self.data)
+            if removed:
+                print(f"画像キャッシュから{removed}件を削除しました")
 
-        # タイトル（余白を小さく）
-        title = Paragraph(f"{grade} プロフィール一覧", japanese_heading)
-        elements.append(title)
-        elements.append(Spacer(1, 5 * mm))  # タイトル下のスペースも縮小
+        # 読み込み中に入力された条件と並べ替えを反映する
+        self.apply_filters()
 
-        # A4ページを2列×2行に分割するレイアウト
-        # 余白が少なくなったので、カードサイズを大きくできる
-        fixed_card_width = 90 * mm  # 固定幅を拡大
-        fixed_card_height = 135 * mm  # 固定高さを拡大
+        elapsed = time.perf_counter() - state['started_at']
+        print(f"CSV読み込み: {len(self.data)}件 {elapsed:.2f}秒")
+        STARTUP_TIMELINE.mark('CSV読み込み完了')
+        self.statusBar().showMessage(f"データ読み込み完了: {filename} ({len(self.data)}件, {elapsed:.1f}秒)")
 
-        # テーブルレイアウト用の配列
-        rows = []
-        current_row = []
+        # 現在のファイルパスを更新
+        self.current_csv_path = filename
+        self.setWindowTitle(f"会員管理アプリケーション - {os.path.basename(filename)}")
 
-        # 一時ファイルのリスト（後で削除するため）
-        temp_files = []
+    def apply_reloaded_data(self, state, search_index, sort_ranks):
+        """再読み込みした名簿と今の名簿の差分を、表示・学年リスト・写真の先読みに反映する"""
+        added, removed, changed = diff_members(self.data, state['items'])
 
-        # カード間のスペースを小さく設定
-        card_spacing = 2  # カード間のスペースを2mmに設定（元の5mmから縮小）
+        # 検索インデックスと並び順は会員IDが読み込み順の位置なので、ワーカーで作り直したものに差し替える
+        self.data = state['items']
+        self.search_index = search_index
+        self.sort_ranks = sort_ranks
 
-        # メンバーごとにプロフィールカードを作成
-        for i, item in enumerate(items):
-            try:
-                # プロフィールカードを作成（固定サイズで）
-                profile_card, tmp_file = self.create_fixed_size_profile_card(item, japanese_style, fixed_card_width, fixed_card_height)
-                if tmp_file:
-                    temp_files.append(tmp_file)
-
-                # 2列のレイアウト
-                current_row.append(profile_card)
-                if len(current_row) == 2:  # 2列に変更
-                    rows.append(current_row)
-                    current_row = []
-
-                # 2行で新しいページ
-                if len(rows) == 2 and current_row == []:
-                    # テーブルでレイアウト（固定サイズ）
-                    profile_table = Table(rows, colWidths=[fixed_card_width] * 2, rowHeights=[fixed_card_height] * 2)
-                    profile_table.setStyle(TableStyle([
-                        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                        ('TOPPADDING', (0, 0), (-1, -1), card_spacing),  # 余白を縮小
-                        ('BOTTOMPADDING', (0, 0), (-1, -1), card_spacing),  # 余白を縮小
-                        ('LEFTPADDING', (0, 0), (-1, -1), card_spacing),  # 余白を縮小
-                        ('RIGHTPADDING', (0, 0), (-1, -1), card_spacing),  # 余白を縮小
-                    ]))
+        # 学年リストを更新（選択中の学年はそのまま残す）
+        selected_grade = self.grade_combo.currentData()
+        self.grade_combo.blockSignals(True)
+        self.grade_combo.clear()
+        self.grade_combo.addItem("すべて", "all")
+        for grade in sorted(grade for grade in search_index.grade_ids if grade):
+            self.grade_combo.addItem(grade, grade)
+        self.grade_combo.setCurrentIndex(max(self.grade_combo.findData(selected_grade), 0))
+        self.grade_combo.blockSignals(False)
+
+        # 写真のURLは行のキーに含まれるため、取得し直すのは追加された行の写真だけ
+        added_urls = {item.photo_url for item in added if item.photo_url}
+        self.image_errors -= added_urls
+        self.image_prefetcher.prefetch(added_urls)
+        if removed and self.prune_image_cache_on_reload:
+            self.image_cache.retain(item.photo_url for item in self.data)
+
+        # 会員の追加・削除・変更があった学年を、PDFの出力し直しが必要な学年として記録する
+        self.changed_grades.update(item.grade for item in added + removed)
+        for old, new in changed:
+            self.changed_grades.update((old.grade, new.grade))
+
+        # 絞り込み結果は、表を作り直さずに行の削除・挿入・変更として反映する
+        self.sync_rows_on_filter = True
+        self.apply_filters()
+
+        filename = state['filename']
+        elapsed = time.perf_counter() - state['started_at']
+        summary = f"追加{len(added)}件・削除{len(removed)}件・変更{len(changed)}件"
+        print(f"CSV再読み込み: {len(self.data)}件 {summary} {elapsed:.2f}秒")
+        self.statusBar().showMessage(f"データ再読み込み完了: {filename} ({summary})")
+
+        self.current_csv_path = filename
+        self.setWindowTitle(f"会員管理アプリケーション - {os.path.basename(filename)}")
+
+    def on_csv_load_failed(self, generation, message):
+        if not self.csv_loader.is_current(generation):
+            return
+        self.csv_loader.loading = False
+        self.csv_load_state = None
+        STARTUP_TIMELINE.mark('CSV読み込みエラー')
+        self.statusBar().showMessage(f"データ読み込みエラー: {message}")
+        QMessageBox.critical(self, "エラー", f"CSVファイルの読み込み中にエラーが発生しました:\n{message}")
 
-                    elements.append(profile_table)
-                    elements.append(Spacer(1, 5 * mm))
+    def open_csv_file(self):
+        """CSVファイル選択ダイアログを開く"""
+        options = QFileDialog.Options()
+        fileName, _ = QFileDialog.getOpenFileName(
+            self,
+            "CSVファイルを選択",
+            os.path.dirname(self.current_csv_path),  # 前回のディレクトリを開く
+            "CSVファイル (*.csv);;すべてのファイル (*)",
+            options=options
+        )
 
-                    # ページを分ける
-                    elements.append(Paragraph("", styles['Normal']))
-                    elements.append(Spacer(1, 5 * mm))  # ページ間のスペースも縮小
+        if fileName:
+            # 選択されたファイルを読み込む
+            self.load_data(fileName)
 
-                    rows = []
-            except Exception as e:
-                print(f"プロフィールカード作成エラー: {e}")
-                # エラーの場合はその会員をスキップ
-                continue
+    def apply_filters(self):
+        """現在の条件での絞り込みをすぐに開始する（結果はon_filter_resultで反映）"""
+        self.filter_scheduler.start()
 
-        # 残りのアイテムを処理
-        if current_row:
-            # 2列になるまで空のセルで埋める
-            while len(current_row) < 2:  # 2列に変更
-                current_row.append("")
-            rows.append(current_row)
-
-        if rows:
-            # 最後の行も固定高さを設定
-            row_heights = [fixed_card_height] * len(rows)
-
-            profile_table = Table(rows, colWidths=[fixed_card_width] * 2, rowHeights=row_heights)  # 2列に変更
-            profile_table.setStyle(TableStyle([
-                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('TOPPADDING', (0, 0), (-1, -1), card_spacing),  # 余白を縮小
-                ('BOTTOMPADDING', (0, 0), (-1, -1), card_spacing),  # 余白を縮小
-                ('LEFTPADDING', (0, 0), (-1, -1), card_spacing),  # 余白を縮小
-                ('RIGHTPADDING', (0, 0), (-1, -1), card_spacing),  # 余白を縮小
-            ]))
+    def current_filter_request(self):
+        """現在の絞り込み・並べ替え条件を返す（GUIスレッドで取得し、ワーカーに渡す）"""
+        # 学年フィルター
+        grade_filter = self.grade_combo.currentData()
 
-            elements.append(profile_table)
+        return {
+            'index': self.search_index,
+            'ranks': self.sort_ranks,
+            'data': self.data,
+            'search_term': self.search_input.text().lower(),  # 検索フィルター
+            'grade': None if grade_filter in ("all", None) else grade_filter,
+            'sort_column': self.sort_column,
+            'sort_order': self.sort_order,
+        }
 
-        try:
-            # PDFを保存
-            doc.build(elements)
-        finally:
-            # 一時ファイルの削除
-            for tmp_file in temp_files:
-                try:
-                    if os.path.exists(tmp_file):
-                        os.unlink(tmp_file)
-                except Exception as e:
-                    print(f"一時ファイル削除エラー: {e}")
+    def on_filter_result(self, generation, request, members):
+        """最新の絞り込み結果だけを表示に反映する"""
+        if not self.filter_scheduler.is_current(generation) or request['data'] is not self.data:
+            return
+        # CSVの行を追加している間は到着順の表示を保つ（完了時に改めて絞り込む）
+        if self.is_streaming_rows():
+            return
 
-    def create_fixed_size_profile_card(self, item, style, card_width, card_height):
-        """一人分の固定サイズプロフィールカードを作成（テキスト開始位置を統一）"""
-        # 固定サイズの枠を作成するため、外側のコンテナを定義
-        # カードの内部コンテンツ用の幅（枠線内側の幅）
-        inner_width = card_width * 0.95  # 内部幅の比率を拡大（余白を少なく）
+        self.filtered_data = members
 
-        # 画像エリアの固定高さ（テキスト開始位置を統一するため）
-        fixed_image_area_height = card_height * 0.5  # カード高さの半分を画像エリアに
+        # 計算中に並べ替え条件が変わった場合は並べ直す
+        if (request['sort_column'], request['sort_order']) != (self.sort_column, self.sort_order):
+            self.sort_data()
 
-        # プロフィール情報を整理
-        texts = []
-        texts.append(f"お名前: {item['parent_name']}")
-        texts.append(f"お子様: {item['child_name']}")
-        if item['child_phrase']:
-            texts.append("")
-            texts.append(f"ご挨拶: ")
-            texts.append(f"{item['child_phrase']}")
-        if item['parent_phrase']:
-            texts.append("")
-            texts.append(f"お住まいの地域: {item['parent_phrase']}")
+        # テーブル更新
+        if self.sync_rows_on_filter:
+            self.sync_rows_on_filter = False
+            self.table_model.sync_members(self.filtered_data)
+        else:
+            self.update_table()
+        self.statusBar().showMessage(f"表示: {len(self.filtered_data)}/{len(self.data)}件")
 
-        # スタイルに最大幅を設定して、テキストが枠からはみ出さないようにする
-        text_style = ParagraphStyle(
-            'FixedWidthStyle',
-            parent=style,
-            wordWrap='CJK',
-            allowWidows=0,
-            allowOrphans=0
+    def sort_data(self):
+        """表示中の会員を、列ごとの並び順（sort_ranks）に従って並べ替える"""
+        member_ids = self.sort_ranks.sort(
+            list(map(attrgetter('member_id'), self.filtered_data)),
+            self.sort_column, self.sort_order == Qt.DescendingOrder
         )
+        self.filtered_data = list(map(self.data.__getitem__, member_ids))
 
-        # 全てのテキストを1つのパラグラフにまとめる
-        content = Paragraph("<br/>".join(texts), text_style)
-
-        # 画像の処理
-        img = None
-        temp_file_path = None
-        img_container = None
+    def sort_table(self, column_index):
+        if column_index in SORT_COLUMN_KEYS:  # ソート可能な列
+            same_column = self.sort_column == column_index
+            if same_column:
+                # 同じ列をクリックした場合は昇順/降順を切り替え
+                self.sort_order = Qt.DescendingOrder if self.sort_order == Qt.AscendingOrder else Qt.AscendingOrder
+            else:
+                # 異なる列の場合は昇順に設定
+                self.sort_column = column_index
+                self.sort_order = Qt.AscendingOrder
 
-        if item['photo_url'] and item['photo_url'].strip():
-            try:
-                # 複数の方法で画像データを取得
-                image_data = self.fetch_image_with_retry(item['photo_url'])
+            # 行の追加中は条件だけ覚えておき、読み込み完了時に並べ替える
+            if self.is_streaming_rows():
+                return
 
-                if not image_data:
-                    raise ValueError(f"画像データを取得できませんでした: {item['photo_url']}")
+            if same_column:
+                # 表示中の会員はこの列の順に並んでいるので、逆順にするだけでよい
+                self.filtered_data = self.filtered_data[::-1]
+            else:
+                self.sort_data()
 
-                # 画像データの検証とファイル拡張子の決定
-                import tempfile
-                from PIL import Image
-                from io import BytesIO
+            # 行は作り直さず、並び順の変更だけを通知する
+            self.table_model.reorder_members(self.filtered_data)
 
-                try:
-                    pil_image = Image.open(BytesIO(image_data))
-                    img_format = pil_image.format
-                    img_ext = img_format.lower() if img_format else 'jpg'
+    def update_table(self):
+        self.table_model.set_members(self.filtered_data)
+
+    def thumbnail_for(self, url):
+        """写真セルに表示する (QPixmapまたはNone, 表示文字列) を返す"""
+        pixmap = self.image_cache.get(url)
+        if pixmap is not None:
+            return pixmap, ""
+        if url in self.image_errors:
+            return None, "読み込みエラー"
+
+        # 先読みが終わったらon_thumbnail_readyで再描画される
+        self.image_prefetcher.prefetch([url])
+        return None, "読み込み中..."
+
+    def on_thumbnail_ready(self, url, image):
+        """先読みしたサムネイルを該当する写真セルに反映する"""
+        if image.isNull():
+            self.image_errors.add(url)
+        else:
+            self.image_cache.put(url, QPixmap.fromImage(image))
 
-                    # 画像のサイズを取得
-                    orig_width, orig_height = pil_image.size
+        self.table_model.thumbnail_updated(url)
 
-                    # 縦横比を計算
-                    aspect_ratio = orig_width / orig_height
+        remaining = len(self.image_prefetcher.pending)
+        if remaining:
+            self.statusBar().showMessage(f"画像読み込み中: 残り{remaining}件")
+        else:
+            stats = self.image_cache.stats()
+            self.statusBar().showMessage(
+                f"画像読み込み完了 ({stats['entries']}件, {stats['bytes'] / (1024 * 1024):.1f}MB, "
+                f"ヒット{stats['hits']}/ミス{stats['misses']})"
+            )
 
-                    # 一時ファイルを閉じる
-                    pil_image.close()
-                except Exception as img_err:
-                    print(f"画像検証エラー: {img_err}")
-                    img_ext = 'jpg'  # デフォルト
-                    aspect_ratio = 1.0  # デフォルト
+    def closeEvent(self, event):
+        """ウィンドウを閉じる際に読み込み・先読み・絞り込みを停止し、接続を閉じる"""
+        self.csv_loader.shutdown()
+        self.filter_scheduler.shutdown()
+        self.image_prefetcher.shutdown()
+        self.image_fetcher.pool.close_all()
+        super().closeEvent(event)
 
-                # 一時ファイルを作成
-                with tempfile.NamedTemporaryFile(delete=False, suffix=f'.{img_ext}') as temp_file:
-                    temp_file.write(image_data)
-                    temp_file_path = temp_file.name
+    def toggle_details(self, row_index):
+        # 詳細表示を切り替え
+        if row_index in self.expanded_rows:
+            self.expanded_rows.pop(row_index)
+            self.details_area.setVisible(False)
+        else:
+            self.expanded_rows = {row_index: True}  # 他の行の詳細表示をクリア
+            self.show_details(row_index)
 
-                # 画像の最大サイズ（内部幅の80%）- 余白が少ないので大きく表示
-                max_img_width = inner_width * 0.8
+    def show_details(self, row_index):
+        item = self.filtered_data[row_index]
 
-                # 縦横比を維持する高さを計算
-                img_height = max_img_width / aspect_ratio if aspect_ratio > 0 else max_img_width
+        # 詳細エリアをクリア
+        for i in reversed(range(self.details_layout.count())):
+            self.details_layout.itemAt(i).widget().setParent(None)
 
-                # 最大高さも制限（固定画像エリアの90%）- 余白が少ないので大きく表示
-                max_img_height = fixed_image_area_height * 0.9
+        # 詳細情報を追加
+        self.details_layout.addWidget(QLabel("<b>基本情報</b>"), 0, 0)
+        self.details_layout.addWidget(QLabel(f"<b>お子様の名前:</b> {item.child_name}"), 1, 0)
+        self.details_layout.addWidget(QLabel(f"<b>ご挨拶:</b> {item.child_phrase}"), 2, 0)
+        self.details_layout.addWidget(QLabel(f"<b>お住まいの地域:</b> {item.parent_phrase}"), 3, 0)
 
-                if img_height > max_img_height:
-                    img_height = max_img_height
-                    max_img_width = img_height * aspect_ratio
+        # 追加情報がある場合のみ表示（エラー防止）
+        if hasattr(item, 'can_participate'):
+            self.details_layout.addWidget(QLabel(f"<b>委員会運営参加:</b> {item.can_participate}"), 4, 0)
 
-                # レポートラボの画像オブジェクト作成を試みる
-                try:
-                    img = ReportLabImage(temp_file_path, width=max_img_width, height=img_height)
+        self.details_layout.addWidget(QLabel("<b>詳細情報</b>"), 0, 1)
 
-                    # 画像を固定高さのコンテナに配置して、位置を中央に
-                    # これにより、画像サイズに関わらずテキスト開始位置を統一
-                    img_container = Table(
-                        [[img]],
-                        colWidths=[inner_width],
-                        rowHeights=[fixed_image_area_height]
-                    )
+        # 追加情報がある場合のみ表示（エラー防止）
+        if hasattr(item, 'reason'):
+            self.details_layout.addWidget(QLabel(f"<b>理由:</b> {getattr(item, 'reason') or '-'}"), 1, 1)
 
-                    img_container.setStyle(TableStyle([
-                        ('ALIGN', (0, 0), (0, 0), 'CENTER'),  # 水平中央揃え
-                        ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),  # 垂直中央揃え
-                        ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                        ('TOPPADDING', (0, 0), (-1, -1), 0),
-                        ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-                    ]))
+        if hasattr(item, 'impression'):
+            # 所感は複数行の可能性があるのでQTextEditで表示
+            impression_label = QLabel(f"<b>委員会への所感:</b> {getattr(item, 'impression') or '-'}")
+            impression_label.setWordWrap(True)
+            self.details_layout.addWidget(impression_label, 2, 1, 2, 1)
 
-                except Exception as rl_err:
-                    print(f"ReportLab画像読み込みエラー: {rl_err}")
+        self.details_area.setVisible(True)
 
-                    # 代替手段: 画像形式を変換して再試行
-                    try:
-                        # PILを使ってJPEGに変換
-                        pil_image = Image.open(temp_file_path)
-                        pil_image = pil_image.convert('RGB')  # 透明度を排除
-
-                        # 新しい一時ファイルに保存
-                        new_temp_path = temp_file_path.rsplit('.', 1)[0] + '.jpg'
-                        pil_image.save(new_temp_path, "JPEG", quality=90)
-                        pil_image.close()
-
-                        # 古い一時ファイルを削除
-                        import os
-                        try:
-                            os.unlink(temp_file_path)
-                        except Exception as del_err:
-                            print(f"古い一時ファイル削除エラー: {del_err}")
-
-                        # 新しいパスを設定
-                        temp_file_path = new_temp_path
-
-                        # 再度ReportLabの画像オブジェクト作成を試みる
-                        img = ReportLabImage(temp_file_path, width=max_img_width, height=img_height)
-
-                        # 画像を固定高さのコンテナに配置
-                        img_container = Table(
-                            [[img]],
-                            colWidths=[inner_width],
-                            rowHeights=[fixed_image_area_height]
-                        )
 
-                        img_container.setStyle(TableStyle([
-                            ('ALIGN', (0, 0), (0, 0), 'CENTER'),  # 水平中央揃え
-                            ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),  # 垂直中央揃え
-                            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                            ('TOPPADDING', (0, 0), (-1, -1), 0),
-                            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-                        ]))
 
-                    except Exception as retry_err:
-                        print(f"画像変換再試行エラー: {retry_err}")
-                        img = None
-                        img_container = None
+    def get_image_data(self, url):
+        """画像データを取得する（ディスクキャッシュにあればネットワークを使わない）"""
+        return self.image_loader.get(url)
 
-                        # 一時ファイルのクリーンアップ
-                        if temp_file_path and os.path.exists(temp_file_path):
-                            try:
-                                os.unlink(temp_file_path)
-                                temp_file_path = None
-                            except Exception as cleanup_err:
-                                print(f"一時ファイル削除エラー: {cleanup_err}")
+    def load_thumbnail_image(self, url):
+        """サムネイル用のQImageを返す（ワーカースレッドから呼び出される）"""
+        key = image_cache_key(url)
+        variant = f"thumb{THUMBNAIL_SIZE}.png"
 
+        # 縮小済みのサムネイルがあればそのまま使う
+        thumbnail_data = self.image_disk_cache.get_variant(key, variant)
+        if thumbnail_data:
+            image = QImage()
+            if image.loadFromData(QByteArray(thumbnail_data)):
+                return image
+
+        image_data = self.get_image_data(url)
+        if not image_data:
+            return QImage()
+
+        image = decode_thumbnail(image_data)
+        if not image.isNull():
+            # 次回以降のためにPNGで保存
+            buffer = QBuffer()
+            buffer.open(QBuffer.WriteOnly)
+            image.save(buffer, "PNG")
+            try:
+                self.image_disk_cache.put_variant(key, variant, bytes(buffer.data()))
             except Exception as e:
-                print(f"プロフィールカード画像処理エラー: {e}")
-                img = None
-                img_container = None
-
-                # 一時ファイルのクリーンアップ
-                if temp_file_path and os.path.exists(temp_file_path):
-                    try:
-                        import os
-                        os.unlink(temp_file_path)
-                        temp_file_path = None
-                    except Exception as cleanup_err:
-                        print(f"エラー後のクリーンアップ失敗: {cleanup_err}")
-
-        # 画像がない場合、空の固定高さコンテナを作成
-        if img_container is None:
-            img_container = Table(
-                [[""]],  # 空のコンテンツ
-                colWidths=[inner_width],
-                rowHeights=[fixed_image_area_height]
-            )
-
-            img_container.setStyle(TableStyle([
-                ('ALIGN', (0, 0), (0, 0), 'CENTER'),
-                ('VALIGN', (0, 0), (0, 0), 'MIDDLE'),
-                ('LEFTPADDING', (0, 0), (-1, -1), 0),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-                ('TOPPADDING', (0, 0), (-1, -1), 0),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-            ]))
-
-        # テキストコンテナ（テキスト部分の高さも固定）
-        text_container = Table(
-            [[content]],
-            colWidths=[inner_width],
-            rowHeights=[card_height - fixed_image_area_height - 5 * mm]  # マージンを小さくして高さを拡大
-        )
-
-        text_container.setStyle(TableStyle([
-            ('ALIGN', (0, 0), (0, 0), 'LEFT'),  # テキストは左揃え
-            ('VALIGN', (0, 0), (0, 0), 'TOP'),  # 上揃え
-            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-            ('TOPPADDING', (0, 0), (-1, -1), 0),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-        ]))
+                print(f"サムネイル保存エラー: {e}")
+        return image
 
-        # 画像エリアとテキストエリアを組み合わせた内部コンテンツ
-        content_table = Table(
-            [
-                [img_container],
-                [text_container]
-            ],
-            colWidths=[inner_width]
-        )
+    def create_pdf_generator(self):
+        """現在のPDF出力の設定でプロフィールPDFの生成器を作る（写真はディスクキャッシュからだけ読む）"""
+        return ProfilePdfGenerator(self.image_loader.get_cached, image_dpi=self.pdf_image_dpi,
+                                   jpeg_quality=self.pdf_jpeg_quality, renderer=self.pdf_renderer)
 
-        content_table.setStyle(TableStyle([
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-            ('TOPPADDING', (0, 0), (-1, -1), 0),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-        ]))
 
-        # 固定サイズのフレーム内に内部コンテンツを配置
-        outer_table = Table(
-            [[content_table]],
-            colWidths=[card_width],
-            rowHeights=[card_height]
-        )
+def read_saved_font_path():
+    """フォント設定ファイルに保存されたフォントのパスを返す（なければNone）"""
+    try:
+        with open(FONT_CONFIG_PATH, 'r', encoding='utf-8') as f:
+            saved_path = f.read().strip()
+    except OSError:
+        return None
+    return saved_path if os.path.exists(saved_path) else None
+
+
+def run_batch_export(args):
+    """GUIを使わずに学年ごとのPDFを出力し、終了ステータスを返す"""
+    if not os.path.exists(args.csv):
+        print(f"ファイルが見つかりません: {args.csv}", file=sys.stderr)
+        return 2
+
+    started = time.perf_counter()
+    items = read_member_csv(args.csv)
+    grade_groups = group_members_by_grade(items)
+    print(f"データ読み込み完了: {args.csv} ({len(items)}件, {time.perf_counter() - started:.2f}秒)")
+
+    # 学年の選択
+    if args.grade:
+        unknown = [grade for grade in args.grade if grade not in grade_groups]
+        if unknown:
+            print(f"CSVに存在しない学年です: {', '.join(unknown)}", file=sys.stderr)
+            print(f"選択できる学年: {', '.join(grade_groups)}", file=sys.stderr)
+            return 2
+        grade_groups = {grade: grade_groups[grade] for grade in args.grade}
+
+    # フォント登録
+    font_path = args.font or read_saved_font_path()
+    if font_path:
+        try:
+            register_japanese_font(font_path)
+            print(f"フォントを登録しました: {font_path}")
+        except Exception as e:
+            print(f"フォント登録エラー: {e}", file=sys.stderr)
+            return 2
+    else:
+        print("日本語フォントが指定されていません。デフォルトフォントを使用します。", file=sys.stderr)
 
-        # 外側のテーブルにスタイルを適用
-        outer_table.setStyle(TableStyle([
-            ('BOX', (0, 0), (-1, -1), 0.5, colors.grey),  # 外枠線
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 3),  # 枠内の余白を小さく
-            ('RIGHTPADDING', (0, 0), (-1, -1), 3),  # 枠内の余白を小さく
-            ('TOPPADDING', (0, 0), (-1, -1), 3),  # 枠内の余白を小さく
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 3),  # 枠内の余白を小さく
-        ]))
+    os.makedirs(args.output_dir, exist_ok=True)
+    loader = ImageLoader(ImageDiskCache(), ImageFetcher())
 
-        return outer_table, temp_file_path
+    # 取得できなかった写真のURL（同じ出力の中では取得し直さない）
+    failed_urls = set()
 
+    def prefetch_photos(urls, label):
+        if not urls:
+            return
+        prefetch_started = time.perf_counter()
+        failed = prefetch_images(loader.get, urls, args.prefetch_concurrency)
+        failed_urls.update(failed)
+        print(f"{label}: {len(urls) - len(failed)}/{len(urls)}枚 "
+              f"(同時{args.prefetch_concurrency}件, {time.perf_counter() - prefetch_started:.2f}秒)")
+
+    # 内容のハッシュが分からない写真だけを、指紋の計算の前に並列で取得する
+    photo_urls = unique_photo_urls(item for grade_items in grade_groups.values() for item in grade_items)
+    prefetch_photos([url for url in photo_urls if loader.known_content_hash(url) is None],
+                    "変更の確認に使う写真の取得")
+
+    # 前回の出力から変わっていない学年は作り直さない（ここからはディスクキャッシュだけを使う）
+    settings = profile_export_settings(font_path, args.dpi, args.jpeg_quality, args.renderer)
+    fingerprints = {grade: grade_fingerprint(grade, grade_items, loader.cached_content_hash, settings)
+                    for grade, grade_items in grade_groups.items()}
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    jobs, reused = plan_profile_export(args.output_dir, grade_groups, fingerprints, timestamp, force=args.force)
+    for grade, existing_file in reused.items():
+        print(f"{grade}: 変更なし -> {existing_file}")
+
+    # 作り直す学年の写真のうち、キャッシュにないものだけを並列で取得する（取得に失敗したものは除く）
+    prefetch_photos([url for url in unique_photo_urls(item for _, grade_items, _ in jobs for item in grade_items)
+                     if url not in failed_urls and not loader.is_cached(url)], "PDFに載せる写真の取得")
+
+    errors = []
+    image_stats = {}
+    if args.jobs > 1 and len(jobs) > 1:
+        # 写真の先読みのスレッドがロックを持ったままforkされないよう、spawnで起動する
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(jobs)),
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {
+                executor.submit(generate_grade_pdf_job, output_file, grade, grade_items, font_path,
+                                args.dpi, args.jpeg_quality, args.renderer): (grade, output_file)
+                for grade, grade_items, output_file in jobs
+            }
+            for future in futures:
+                grade, output_file = futures[future]
+                try:
+                    stats = future.result()
+                    elapsed = stats.pop('elapsed')
+                    merge_image_stats(image_stats, stats)
+                    print(f"{grade}: {elapsed:.2f}秒 -> {output_file}")
+                except Exception as e:
+                    print(f"{grade}: エラー {e}", file=sys.stderr)
+                    errors.append(grade)
+    else:
+        generator = ProfilePdfGenerator(loader.get_cached, image_dpi=args.dpi, jpeg_quality=args.jpeg_quality,
+                                        renderer=args.renderer)
+        for grade, grade_items, output_file in jobs:
+            grade_started = time.perf_counter()
+            try:
+                merge_image_stats(image_stats, generator.generate_profile_pdf(output_file, grade, grade_items))
+                print(f"{grade}: {time.perf_counter() - grade_started:.2f}秒 -> {output_file}")
+            except Exception as e:
+                print(f"{grade}: エラー {e}", file=sys.stderr)
+                errors.append(grade)
+
+    record_profile_exports(args.output_dir, [
+        (grade, output_file) for grade, _, output_file in jobs if grade not in errors
+    ], fingerprints)
+
+    print(format_image_stats(image_stats))
+    print(f"{len(jobs) - len(errors)}/{len(jobs)}学年のPDF出力が完了しました"
+          f"（変更なし{len(reused)}学年） ({time.perf_counter() - started:.2f}秒)")
+    return 1 if errors else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="会員管理アプリケーション（--csvを指定するとGUIを起動せずにPDFを出力する）")
+    parser.add_argument("--csv", help="PDFを出力するCSVファイル（指定するとGUIを起動しない）")
+    parser.add_argument("--output-dir", help="PDFの保存先フォルダ")
+    parser.add_argument("--font", help="PDF用の日本語フォント（.ttf/.otf）。省略時は保存された設定を使用")
+    parser.add_argument("--grade", action="append",
+                        help="出力する学年（複数指定可）。省略時はすべての学年")
+    parser.add_argument("--jobs", type=int, default=1, help="並列に生成するプロセス数")
+    parser.add_argument("--dpi", type=int, default=PDF_IMAGE_DPI, help="PDFに埋め込む写真の解像度（DPI）")
+    parser.add_argument("--jpeg-quality", type=int, default=PDF_IMAGE_JPEG_QUALITY,
+                        help="PDFに埋め込む写真のJPEG品質（1-95）")
+    parser.add_argument("--renderer", choices=ProfilePdfGenerator.RENDERERS, default='platypus',
+                        help="PDFの描画方式（canvasはカードを座標に直接描画する高速な方式）")
+    parser.add_argument("--prefetch-concurrency", type=int, default=PDF_PREFETCH_CONCURRENCY,
+                        help="PDFの生成前に写真をまとめて取得するときの同時取得数")
+    parser.add_argument("--force", action="store_true",
+                        help="前回の出力から変更のない学年もPDFを作り直す")
+    parser.add_argument("--startup-timeline", action="store_true",
+                        help="GUIの起動の各段階（読み込み・フォント・CSV・最初の描画）の所要時間を表示する")
+    args, qt_args = parser.parse_known_args(argv)
+
+    if args.csv:
+        if not args.output_dir:
+            parser.error("--csvを指定する場合は--output-dirも必要です")
+        return run_batch_export(args)
+
+    STARTUP_TIMELINE.enabled = args.startup_timeline
+    STARTUP_TIMELINE.mark('モジュールの読み込み')
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    STARTUP_TIMELINE.mark('Qtの初期化')
+    window = MemberManagementApp()
+    window.show()
+    return app.exec_()
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    window = MemberManagementApp()
-    window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(main())
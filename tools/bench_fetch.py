@@ -0,0 +1,112 @@
+"""ImageFetcherの1枚あたりの取得時間を、ローカルのHTTPスタブサーバーで計測する
+
+    python tools/bench_fetch.py [--photos 50] [--failing-photos 1]
+
+127.0.0.1 に固定の応答（画像 / 404 / 503）を返すサーバーを立て、URLパターンを
+そのサーバーに向けたImageFetcherで写真を取得する。シナリオごとに1枚あたりの
+取得時間の中央値（p50）と最大値を表示する。
+"""
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import ImageFetcher  # noqa: E402
+
+# 画像として返す固定のデータ（最小サイズのチェックを通る大きさにする）
+STUB_IMAGE = b'\xff\xd8\xff\xe0' + bytes(2044)
+
+# パス先頭 -> (ステータス, 本文)
+STUB_RESPONSES = {
+    'ok': (200, STUB_IMAGE),
+    'missing': (404, b'not found'),
+    'busy': (503, b'service unavailable'),
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """/<ok|missing|busy>/<ファイルID> に固定の応答を返す"""
+
+    protocol_version = 'HTTP/1.1'
+    # ヘッダーと本文を別々に書き込むため、Nagleの遅延が計測に混ざらないようにする
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        kind = self.path.strip('/').split('/', 1)[0]
+        status, body = STUB_RESPONSES.get(kind, STUB_RESPONSES['missing'])
+        self.send_response(status)
+        self.send_header('Content-Type', 'image/jpeg' if status == 200 else 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def stub_patterns(base_url, kinds):
+    """スタブサーバーに向けたURLパターン（{file_id}を含む）を返す"""
+    return [f"{base_url}/{kind}/{{file_id}}" for kind in kinds]
+
+
+def measure(base_url, kinds, photo_count):
+    """新しいImageFetcherでphoto_count枚を順に取得し、(1枚ごとの秒数, 成功数)を返す"""
+    fetcher = ImageFetcher(url_patterns=stub_patterns(base_url, kinds))
+    durations = []
+    succeeded = 0
+
+    for i in range(photo_count):
+        url = f"https://drive.google.com/open?id=benchphoto{i:020d}"
+        started = time.perf_counter()
+        # ImageFetcherの試行ごとのログは計測結果の表示に不要なので捨てる
+        with contextlib.redirect_stdout(io.StringIO()):
+            image_data = fetcher.fetch(url)
+        durations.append(time.perf_counter() - started)
+        if image_data:
+            succeeded += 1
+
+    fetcher.pool.close_all()
+    return durations, succeeded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ImageFetcherの取得時間をローカルのスタブサーバーで計測する")
+    parser.add_argument("--photos", type=int, default=50, help="成功するシナリオで取得する枚数")
+    parser.add_argument("--failing-photos", type=int, default=1,
+                        help="サーバーエラーが続くシナリオで取得する枚数（1枚あたり最大20秒かかる）")
+    args = parser.parse_args(argv)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # (名前, URLパターンごとの応答, 枚数)
+    scenarios = [
+        ("最初のパターンで取得できる", ['ok', 'ok', 'ok', 'ok', 'ok'], args.photos),
+        ("3番目のパターンで取得できる", ['missing', 'missing', 'ok', 'ok', 'ok'], args.photos),
+        ("ファイルが存在しない (404)", ['missing'] * 5, args.photos),
+        ("サーバーエラーが続く (503)", ['busy'] * 5, args.failing_photos),
+    ]
+
+    try:
+        for name, kinds, photo_count in scenarios:
+            if photo_count <= 0:
+                continue
+            durations, succeeded = measure(base_url, kinds, photo_count)
+            print(f"{name}: {succeeded}/{photo_count}枚取得, "
+                  f"p50 {statistics.median(durations) * 1000:.1f}ms, "
+                  f"最大 {max(durations) * 1000:.1f}ms")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()